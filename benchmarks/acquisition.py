@@ -0,0 +1,49 @@
+''' Acquisition throughput benchmark. Streams AIN channels from a simulated
+    device on a virtual clock, so that the device never limits the rate, and
+    measures how many samples per second ADCStream.read delivers on the host.
+    A realtime_factor below 1 means the host could not keep up with a real
+    device at that rate. Prints one JSON object per line.
+
+    Usage:
+        python benchmarks/acquisition.py [--seconds 10]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labyak import LabJack
+from labyak.simulated import SimulatedLJM
+
+CHANNELS = [1, 4, 8]
+SAMPLE_RATES = [1000, 10000, 100000]    ## samples per second over all channels
+
+def run(channels, sample_rate, seconds):
+    lj = LabJack(backend=SimulatedLJM(realtime=False), verbose=False)
+    names = ['AIN%i'%i for i in range(channels)]
+    lj.adc_stream.start(names, sample_rate/channels)
+    lj.adc_stream.read()    ## warm up imports
+    samples, reads = 0, 0
+    start = time.perf_counter()
+    while samples < seconds*sample_rate:
+        samples += lj.adc_stream.read().size
+        reads += 1
+    elapsed = time.perf_counter() - start
+    lj.adc_stream.stop()
+    return {'benchmark': 'acquisition',
+            'channels': channels,
+            'sample_rate': sample_rate,
+            'reads': reads,
+            'samples_per_s': samples/elapsed,
+            'realtime_factor': samples/elapsed/sample_rate}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10, help='seconds of device data to read per point')
+    args = parser.parse_args()
+
+    for channels in CHANNELS:
+        for sample_rate in SAMPLE_RATES:
+            print(json.dumps(run(channels, sample_rate, args.seconds)))
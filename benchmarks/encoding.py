@@ -0,0 +1,67 @@
+''' Pattern compilation benchmark. Times Digital.array_to_bitmask on state
+    arrays of typical buffer sizes and PatternGenerator.optimize_stream on
+    sequences with growing numbers of channels and edges. Prints one JSON
+    object per line.
+
+    Usage:
+        python benchmarks/encoding.py [--repeat 5]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labyak import LabJack, Digital
+from labyak.simulated import SimulatedLJM
+
+CHANNELS = [1, 4, 8, 16]
+SAMPLES = [1000, 4096, 8191]
+EDGES = [10, 100, 1000]
+PERIOD = 0.1
+
+def median_ms(fn, repeat):
+    fn()    ## warm up
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1e3*float(np.median(times))
+
+def sequence(channels, edges, period):
+    ''' Returns a reproducible sequence with the given number of edges per
+        channel, on times which are multiples of 1 us. '''
+    rng = np.random.default_rng(0)
+    ticks = int(period*1e6)
+    return {ch: [(t*1e-6, i % 2) for i, t in enumerate(np.sort(rng.choice(ticks, edges, replace=False)))]
+            for ch in range(channels)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for n in CHANNELS:
+        for samples in SAMPLES:
+            states = np.random.default_rng(0).integers(0, 2, (samples, n))
+            print(json.dumps({'benchmark': 'array_to_bitmask',
+                              'channels': n,
+                              'samples': samples,
+                              'ms_median': median_ms(lambda: Digital.array_to_bitmask(states, list(range(n))), args.repeat)}))
+
+    pattern = LabJack(backend=SimulatedLJM(realtime=False), verbose=False).pattern
+    for n in CHANNELS:
+        for edges in EDGES:
+            seq = sequence(n, edges, PERIOD)
+            data, scanRate = pattern.optimize_stream(seq, PERIOD)
+            print(json.dumps({'benchmark': 'optimize_stream',
+                              'channels': n,
+                              'edges': edges,
+                              'period': PERIOD,
+                              'output_samples': len(data),
+                              'scanRate': scanRate,
+                              'timing_error_s': pattern.timing_error,
+                              'ms_median': median_ms(lambda: pattern.optimize_stream(seq, PERIOD), args.repeat)}))
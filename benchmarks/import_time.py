@@ -0,0 +1,54 @@
+''' Import-time benchmark. Measures `import labyak` and LabJack construction
+    in fresh interpreters and fails if the heavy scientific dependencies or
+    asyncio and concurrent.futures are imported eagerly, or if the median
+    import time exceeds --max-ms.
+
+    Usage:
+        python benchmarks/import_time.py [--repeat 10] [--max-ms 500]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY = ['scipy', 'pandas', 'asyncio', 'concurrent.futures']
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import labyak
+t1 = time.perf_counter()
+from labyak.simulated import SimulatedLJM
+lj = labyak.LabJack(backend=SimulatedLJM(), verbose=False)
+lj.digital.DOut(3, 1)
+t2 = time.perf_counter()
+print(json.dumps({'import_s': t1-t0, 'construct_s': t2-t1,
+                  'heavy': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+def measure(repeat):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE], cwd=root, capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {'benchmark': 'import_time',
+            'repeat': repeat,
+            'import_ms_median': 1e3*statistics.median(r['import_s'] for r in runs),
+            'construct_ms_median': 1e3*statistics.median(r['construct_s'] for r in runs),
+            'heavy_modules': sorted({m for r in runs for m in r['heavy']})}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    result = measure(args.repeat)
+    print(json.dumps(result))
+    if result['heavy_modules']:
+        sys.exit('Heavy modules imported eagerly: %s'%result['heavy_modules'])
+    if args.max_ms is not None and result['import_ms_median'] > args.max_ms:
+        sys.exit('Import took %.1f ms (limit %.1f ms)'%(result['import_ms_median'], args.max_ms))
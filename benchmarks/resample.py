@@ -0,0 +1,60 @@
+''' Waveform resampling benchmark. Times each Stream.resample strategy on
+    typical waveform sizes, for a looped buffer (8191 samples) and for
+    continuous output at the full scan rate, using the simulated backend.
+    Prints one JSON object per line.
+
+    Usage:
+        python benchmarks/resample.py [--repeat 5]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labyak import LabJack
+from labyak.simulated import SimulatedLJM
+
+SIZES = [1000, 4096, 10007, 100000]
+PERIODS = [0.01, 1/7, 0.5]
+
+def waveform(t):
+    return np.sin(2*np.pi*t/0.5) + 0.3*np.sin(2*np.pi*7*t/0.5)
+
+def run(stream, array, period, max_samples, method, exact, repeat):
+    stream.resample(array, period, max_samples=max_samples, method=method, exact=exact)    ## warm up imports
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        data, scanRate = stream.resample(array, period, max_samples=max_samples, method=method, exact=exact)
+        times.append(time.perf_counter() - start)
+    t = np.arange(len(data)) * (period / len(data))
+    actual = stream.CLOCK / round(stream.CLOCK / scanRate)    ## rate after rounding to the stream clock
+    return {'benchmark': 'resample',
+            'method': 'analytic' if callable(array) else method,
+            'exact': exact,
+            'input_samples': None if callable(array) else len(array),
+            'output_samples': len(data),
+            'period': period,
+            'scanRate': scanRate,
+            'loop_error_s': abs(len(data)/actual - period),
+            'max_error': float(np.abs(data - waveform(t*0.5/period)).max()),
+            'ms_median': 1e3*float(np.median(times))}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stream = LabJack(backend=SimulatedLJM(realtime=False), verbose=False).stream
+    for period in PERIODS:
+        for max_samples in [8191, None]:
+            for exact in [False, True]:
+                for n in SIZES:
+                    array = waveform(np.arange(n) * (0.5/n))
+                    for method in ['fft', 'poly', 'linear']:
+                        print(json.dumps(run(stream, array, period, max_samples, method, exact, args.repeat)))
+                analytic = lambda t: waveform(t*0.5/period)
+                print(json.dumps(run(stream, analytic, period, max_samples, None, exact, args.repeat)))
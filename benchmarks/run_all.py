@@ -0,0 +1,121 @@
+''' Runs every benchmark and writes their results, together with the
+    interpreter, library versions and git commit, as one JSON document. With
+    --baseline the results are compared against an earlier document and the
+    script exits non-zero if any benchmark regressed: timings by more than
+    --tolerance (and at least --min-ms), or round trips, calls and bytes by
+    any amount.
+
+    Usage:
+        python benchmarks/run_all.py --output results.json
+        python benchmarks/run_all.py --quick --baseline results.json
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+''' Benchmark scripts with their arguments for full and --quick runs. '''
+BENCHMARKS = [('import_time.py', ['--repeat', '10'], ['--repeat', '3']),
+              ('encoding.py', ['--repeat', '20'], ['--repeat', '5']),
+              ('resample.py', ['--repeat', '5'], ['--repeat', '2']),
+              ('upload.py', ['--repeat', '20'], ['--repeat', '5']),
+              ('acquisition.py', ['--seconds', '10'], ['--seconds', '2'])]
+
+''' Result fields compared against the baseline; all others identify a result. '''
+TIMINGS = ('ms_median',)
+COUNTS = ('calls', 'packets', 'bytes_out', 'bytes_in')
+RATES = ('samples_per_s',)
+DERIVED = ('realtime_factor',)
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    versions = {}
+    for module in ['numpy', 'scipy', 'pandas']:
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit or None,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'versions': versions}
+
+def run(script, args):
+    out = subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', script)] + args,
+                         cwd=ROOT, capture_output=True, text=True)
+    results = [json.loads(line) for line in out.stdout.splitlines() if line.startswith('{')]
+    if out.returncode:
+        results.append({'benchmark': script, 'error': out.stderr.strip().splitlines()[-1:]})
+    return results
+
+def identity(result):
+    return json.dumps({k: v for k, v in result.items()
+                       if not k.endswith(TIMINGS + COUNTS + RATES + DERIVED)}, sort_keys=True)
+
+def compare(results, baseline, tolerance, min_ms=0.5):
+    ''' Returns a list of regression messages for results matching a baseline
+        result with the same identifying fields. '''
+    previous = {identity(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        if 'error' in result:
+            regressions.append('%s failed: %s'%(result['benchmark'], result['error']))
+            continue
+        old = previous.get(identity(result))
+        if old is None:
+            continue
+        for key, value in result.items():
+            if key not in old or old[key] is None or value is None:
+                continue
+            if key.endswith(TIMINGS) and value > max(old[key]*(1+tolerance), old[key]+min_ms):
+                change = '%.3g ms -> %.3g ms'%(old[key], value)
+            elif key.endswith(COUNTS) and value > old[key]:
+                change = '%i -> %i'%(old[key], value)
+            elif key.endswith(RATES) and value < old[key]/(1+tolerance):
+                change = '%.3g -> %.3g'%(old[key], value)
+            else:
+                continue
+            regressions.append('%s %s: %s'%(identity(result), key, change))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', help='file to write the results to (default stdout)')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown of timings')
+    parser.add_argument('--min-ms', type=float, default=0.5, help='ignore slowdowns of timings below this')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats, for CI')
+    parser.add_argument('--only', nargs='*', help='benchmark scripts to run, e.g. upload.py')
+    args = parser.parse_args()
+
+    results = []
+    for script, full, quick in BENCHMARKS:
+        if args.only and script not in args.only:
+            continue
+        print('Running %s'%script, file=sys.stderr)
+        results += run(script, quick if args.quick else full)
+    document = {'meta': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(document, file, indent=1)
+    else:
+        print(json.dumps(document, indent=1))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)['results'], args.tolerance, args.min_ms)
+        for message in regressions:
+            print('Regression: %s'%message, file=sys.stderr)
+        if regressions:
+            sys.exit('%i regressions against %s'%(len(regressions), args.baseline))
+    elif any('error' in result for result in results):
+        sys.exit('Benchmarks failed: %s'%[r['benchmark'] for r in results if 'error' in r])
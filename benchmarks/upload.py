@@ -0,0 +1,64 @@
+''' Stream-out upload benchmark. Starts looped buffers of typical sizes
+    through Stream._start on simulated USB and Ethernet devices and reports
+    the round trips and bytes each start costs, along with the host time
+    spent. Prints one JSON object per line.
+
+    Usage:
+        python benchmarks/upload.py [--repeat 5]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labyak import LabJack
+from labyak.simulated import SimulatedLJM, SimulatedDevice, constants
+
+SAMPLES = [1000, 4096, 8191]
+CONNECTIONS = {'USB': constants.ctUSB, 'ETHERNET': constants.ctETHERNET}
+
+''' Stream targets and data type for each output configuration: voltages to
+    the DACs, or U16 port words as written by PatternGenerator. '''
+TARGETS = [('F32', ['DAC0']),
+           ('F32', ['DAC0', 'DAC1']),
+           ('U16', ['FIO_STATE']),
+           ('U16', ['FIO_STATE', 'EIO_STATE', 'CIO_STATE'])]
+
+def run(connection, dtype, targets, samples, repeat):
+    sim = SimulatedLJM(devices=[SimulatedDevice(connection_type=CONNECTIONS[connection])], realtime=False)
+    lj = LabJack(backend=sim, verbose=False)
+    addresses = [lj._resolve(target)[0] for target in targets]
+    data = np.random.default_rng(0).random((samples, len(targets)))
+    if dtype == 'U16':
+        data = (data*0xFFFF).astype(np.uint16)
+    lj.stream._start(addresses, data, 10000, loop=1, dtype=dtype)    ## warm up name resolution
+    times = []
+    for i in range(repeat):
+        sim.reset_stats()
+        start = time.perf_counter()
+        lj.stream._start(addresses, data, 10000, loop=1, dtype=dtype)
+        times.append(time.perf_counter() - start)
+    total = sim.stats()['total']
+    return {'benchmark': 'upload',
+            'connection': connection,
+            'dtype': dtype,
+            'targets': targets,
+            'samples': samples,
+            'calls': total['calls'],
+            'packets': total['packets'],
+            'bytes_out': total['bytes_out'],
+            'bytes_in': total['bytes_in'],
+            'ms_median': 1e3*float(np.median(times))}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for connection in CONNECTIONS:
+        for dtype, targets in TARGETS:
+            for samples in SAMPLES:
+                print(json.dumps(run(connection, dtype, targets, samples, args.repeat)))
@@ -4,8 +4,25 @@ from .temperature import Temperature
 from .pwm import PWM
 from .spi import SPI
 from .i2c import I2C
+from .stream_feeder import StreamFeeder
+from .stream_session import StreamSession
 from .stream import Stream
 from .waveform_generator import WaveformGenerator
 from .pattern_generator import PatternGenerator
+from .ring_buffer import RingBuffer
+from .recorder import StreamRecorder, StreamReader
 from .adc_stream import ADCStream
+from .registers import RegisterBatch
+from .buffer_cache import BufferCache
 from .core import LabJack
+
+def __getattr__(name):
+    ''' Imports LabJackPool and AsyncLabJack on first use, so that
+        `import labyak` does not pay for concurrent.futures and asyncio. '''
+    if name == 'LabJackPool':
+        from .pool import LabJackPool
+        return LabJackPool
+    if name == 'AsyncLabJack':
+        from .async_labjack import AsyncLabJack
+        return AsyncLabJack
+    raise AttributeError("module 'labyak' has no attribute %r"%name)
@@ -1,35 +1,129 @@
-from labjack import ljm
 import numpy as np
-import pandas as pd
 import time
 import datetime
+import threading
+from labyak.ring_buffer import RingBuffer
+from labyak.recorder import StreamRecorder
 
 class ADCStream:
     def __init__(self, labjack):
         self.labjack = labjack
+        self.lock = threading.Lock()    ## guards scan_count and recorder against the stream callback
 
     def start(self, channels, scanRate):
+        ''' Starts streaming. If a trigger is armed (see Stream.arm) the start
+            time is unknown until the trigger fires, so it is left as None and
+            anchored when the first block is read. '''
         self.scanRate = scanRate
         # self.effective_scan_rate = scanRate / len(channels)
         self.channels = channels
-        self.labjack.stream.configure(settling_time=0, resolution_index=0, clock_source=0)
-        self.labjack.stream.set_trigger(None)
-        self.labjack.stream.AIn_start(channels, scanRate)
+        with self.labjack.batch():
+            self.labjack.stream.configure(settling_time=0, resolution_index=0, clock_source=0)
+            self.labjack.stream.set_trigger(self.labjack.stream.trigger)
+            self.scanRate = self.labjack.stream.AIn_start(channels, scanRate)
+        self.start_time = None if self.labjack.stream.trigger is not None else self.now()
+        self.scan_count = 0
+
+    @staticmethod
+    def now():
+        return np.datetime64(datetime.datetime.utcnow(), 'ns')
+
+    def _anchor(self, n, backlog=0):
+        ''' Sets the start time of a triggered stream when a block of n scans
+            arrives, counting back from now over the scans acquired so far:
+            those already read, the block and the backlog left in LJM. '''
+        if self.start_time is not None:
+            return
+        acquired = self.scan_count + n + backlog
+        self.start_time = self.now() - np.timedelta64(int(round(acquired * 1e9 / self.scanRate)), 'ns')
+        if getattr(self, 'recorder', None) is not None:
+            self.recorder.anchor(self.start_time)
 
     def sample(self):
         return self.labjack.stream.AIn_read()
 
-    def read(self):
-        data = np.array(self.labjack.stream.AIn_read()[0])
-        # tmax = len(data) / len(self.channels) / self.effective_scan_rate
-        # t = time.time() + np.arange(0, tmax, 1/self.effective_scan_rate)
-        now = datetime.datetime.utcnow()
+    def times(self, first, n):
+        ''' Returns datetime64 timestamps of n scans starting at scan index first. '''
+        if self.start_time is None:
+            raise RuntimeError('The stream is waiting for its trigger; timestamps are known once a block is read')
+        offsets = (first + np.arange(n)) * (1e9 / self.scanRate)
+        return self.start_time + offsets.round().astype('timedelta64[ns]')
+
+    def timestamps(self, n, backlog=0):
+        ''' Returns datetime64 timestamps for the next n scans, computed from the
+            stream start time and the number of scans read so far. Scans skipped
+            by auto-recovery are returned as -9999 and still advance the count,
+            so the timestamps stay exact. For a triggered stream the first call
+            anchors the start time; pass the LJM backlog returned by the read. '''
+        self._anchor(n, backlog)
+        times = self.times(self.scan_count, n)
+        self.scan_count += n
+        return times
+
+    def start_background(self, channels, scanRate, capacity=None):
+        ''' Starts streaming into a preallocated ring buffer filled by LJM's
+            stream callback, so that acquisition never waits on consumers.
+            Use latest() and since() to access the data.
+
+            Args:
+                channels (list): AIN channel names, e.g. ['AIN0', 'AIN1'].
+                scanRate (float): scans per second.
+                capacity (int): number of scans retained; defaults to 10 seconds.
+        '''
+        self.start(channels, scanRate)
+        self.ring = RingBuffer(capacity or int(10*self.scanRate), len(channels))
+        self.recorder = None
+        self.error = None
+        self.labjack.ljm.setStreamCallback(self.labjack.handle, self._callback)
 
+    def _callback(self, handle):
+        try:
+            data, device_backlog, backlog = self.labjack.stream.AIn_read()
+            block = np.asarray(data).reshape(-1, len(self.channels))
+            block[block == -9999.0] = np.nan
+            with self.lock:
+                self._anchor(len(block), backlog)
+                self.ring.write(block)
+                if self.recorder is not None:
+                    self.recorder.write(block)
+                self.scan_count += len(block)
+        except Exception as e:
+            self.error = e
+
+    def latest(self, n):
+        ''' Returns a view of the most recent n scans from the background buffer. '''
+        return self.ring.latest(n)
+
+    def since(self, cursor=0):
+        ''' Returns a view of the scans acquired since cursor, the cursor for the
+            next call and the scan index of the first returned row (see times()). '''
+        return self.ring.since(cursor)
+
+    def record(self, path, segment_scans=1000000):
+        ''' Appends all further background scans to an on-disk recording which
+            can be read back with labyak.recorder.StreamReader. Scans acquired
+            before this call are not recorded. If the stream is still waiting
+            for its trigger, the start time is written once it is known. '''
+        with self.lock:     ## no block may arrive between anchoring and attaching
+            start_time = self.times(self.scan_count, 1)[0] if self.start_time is not None else None
+            recorder = StreamRecorder(path, self.channels, self.scanRate, start_time, segment_scans=segment_scans)
+            self.recorder = recorder
+        return recorder
+
+    def stop(self):
+        ''' Stops streaming, including any background acquisition and recording. '''
+        self.labjack.stream.stop()
+        with self.lock:
+            recorder, self.recorder = getattr(self, 'recorder', None), None
+        if recorder is not None:
+            recorder.close()
+
+    def read(self):
+        import pandas as pd
+        data, device_backlog, backlog = self.labjack.stream.AIn_read()
+        data = np.array(data)
         n = int(len(data) / len(self.channels))
-        dt = 1 / self.scanRate
-        times = []
-        for i in range(n):
-            times.append(now + datetime.timedelta(seconds=i*dt))
+        times = self.timestamps(n, backlog)
         data = pd.DataFrame(data.reshape(-1, len(self.channels)), columns=self.channels, index=times)
         return data[data != -9999.0]
 
@@ -1,11 +1,38 @@
+import struct
+import time
+import numpy as np
+
 class Analog():
+    ''' Above this many samples per second (scan rate times number of channels),
+        sample() uses hardware-timed streaming instead of polling. '''
+    POLL_LIMIT = 500
+
+    ''' Flash address of the T7 calibration constants and byte offset of the
+        DAC0 and DAC1 (slope, offset) pairs within them. '''
+    CALIBRATION_ADDRESS = 0x3C4000
+    DAC_CALIBRATION_OFFSET = 128
+
     def __init__(self, labjack):
         self.labjack = labjack
+        self.batches = {}
+        self.calibration = None
 
     def AIn(self, channel):
         ''' Read a channel and return the voltage. '''
         return self.labjack._query('AIN{}'.format(channel))
 
+    def AIn_many(self, channels):
+        ''' Reads several channels in one packet and returns their voltages.
+
+            Args:
+                channels (list): AIN channel numbers.
+        '''
+        channels = tuple(channels)
+        batch = self.batches.get(('read', channels))
+        if batch is None:
+            batch = self.batches[('read', channels)] = self.labjack.compile([f'AIN{ch}' for ch in channels])
+        return np.array(batch.read())
+
     def AOut(self, channel, value):
         ''' Output an analog voltage.
 
@@ -15,6 +42,119 @@ class Analog():
         '''
         self.labjack._command('%s%i'%('DAC', channel), value)
 
+    def AOut_many(self, values):
+        ''' Sets several DAC channels in one packet.
+
+            Args:
+                values (dict): DAC channel number -> voltage, e.g. {0: 1.5, 1: 0}.
+        '''
+        channels = tuple(values)
+        batch = self.batches.get(('write', channels))
+        if batch is None:
+            batch = self.batches[('write', channels)] = self.labjack.compile([f'DAC{ch}' for ch in channels])
+        batch.write(values.values())
+
+    def dac_calibration(self):
+        ''' Returns the (slope, offset) calibration of DAC0 and DAC1 as a 2x2
+            array, read from the device's flash on the first call and cached. A
+            voltage V corresponds to the 16-bit DAC code V*slope + offset. '''
+        if self.calibration is None:
+            if self.labjack.deviceType != self.labjack.ljm.constants.dtT7:
+                raise ValueError('DAC calibration constants are only available on the T7.')
+            self.labjack._command('INTERNAL_FLASH_READ_POINTER', self.CALIBRATION_ADDRESS + self.DAC_CALIBRATION_OFFSET)
+            self.labjack.barrier()
+            raw = self.labjack.ljm.eReadNameByteArray(self.labjack.handle, 'INTERNAL_FLASH_READ', 16)
+            self.calibration = np.array(struct.unpack('>4f', bytes(raw))).reshape(2, 2)
+        return self.calibration
+
+    def quantize(self, V, channels, return_error=False):
+        ''' Converts voltages to calibrated DAC codes for STREAM_OUT#_BUFFER_U16.
+            Codes are clipped to the output range and rounded to the 12 bits
+            the DACs resolve.
+
+            Args:
+                V (array): samples x channels voltages (1-D for one channel).
+                channels (list): DAC channel of each column.
+                return_error (bool): if True, also return the output voltage
+                                     minus the requested voltage.
+
+            Returns:
+                codes (ndarray): uint16 array shaped like V.
+                error (ndarray): quantization and clipping error in volts, if
+                                 return_error is True.
+        '''
+        slope, offset = self.dac_calibration()[list(channels)].T
+        V = np.asarray(V, dtype=float)
+        codes = (np.clip(np.rint((V*slope + offset) / 16), 0, 4095) * 16).astype(np.uint16)
+        if return_error:
+            return codes, (codes - offset) / slope - V
+        return codes
+
+    def configure(self, channels, arange=None, resolution=None, settling=None):
+        ''' Sets the input range, resolution index and settling time of several
+            channels in one batch. Each setting is either a single value for all
+            channels, a dict of channel -> value, or None to leave it unchanged.
+
+            Args:
+                channels (list): AIN channel numbers.
+                arange (float): input range in volts, e.g. 10, 1, 0.1 or 0.01.
+                resolution (int): resolution index, 0 for the device default.
+                settling (float): settling time in microseconds, 0 for automatic.
+        '''
+        registers = {}
+        for suffix, setting in [('RANGE', arange), ('RESOLUTION_INDEX', resolution), ('SETTLING_US', settling)]:
+            if setting is None:
+                continue
+            for ch in channels:
+                value = setting.get(ch) if isinstance(setting, dict) else setting
+                if value is not None:
+                    registers[f'AIN{ch}_{suffix}'] = value
+        with self.labjack.batch():
+            self.labjack._write_dict(registers)
+
+    def sample(self, channels, rate, duration):
+        ''' Acquires scans of several channels at a fixed rate. Slow acquisitions
+            poll with AIn_many(); faster ones (see POLL_LIMIT) are hardware timed
+            with Stream.AIn_start(), in which case the device may round the rate.
+
+            Args:
+                channels (list): AIN channel numbers.
+                rate (float): scans per second.
+                duration (float): acquisition time in seconds.
+
+            Returns:
+                data (ndarray): scans x channels array of voltages, with scans
+                                skipped by stream auto-recovery as NaN.
+        '''
+        n = int(round(rate*duration))
+        if rate*len(channels) > self.POLL_LIMIT:
+            return self._sample_stream(channels, rate, n)
+        data = np.empty((n, len(channels)))
+        start = time.monotonic()
+        for i in range(n):
+            delay = start + i/rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            data[i] = self.AIn_many(channels)
+        return data
+
+    def _sample_stream(self, channels, rate, n):
+        stream = self.labjack.stream
+        with self.labjack.batch():
+            stream.set_trigger(stream.trigger)
+            stream.AIn_start([f'AIN{ch}' for ch in channels], rate)
+        blocks, scans = [], 0
+        try:
+            while scans < n:
+                block = np.asarray(stream.AIn_read()[0], dtype=float).reshape(-1, len(channels))
+                blocks.append(block)
+                scans += len(block)
+        finally:
+            stream.stop()
+        data = np.concatenate(blocks)[:n]
+        data[data == -9999.0] = np.nan
+        return data
+
     def TDAC(self, channel, value):
         ''' Output an analog voltage.
 
@@ -0,0 +1,168 @@
+''' asyncio interface to a LabJack. Blocking LJM calls run on a single worker
+    thread per device, so an event loop can serve many devices and clients
+    without blocking, while commands to any one device keep their order. '''
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from labyak.core import LabJack
+
+class AsyncModule:
+    ''' Wraps a LabJack submodule so that each method call returns an awaitable
+        executed on the device's worker thread. Attributes which are not
+        methods are passed through unchanged. '''
+    def __init__(self, device, module):
+        self._device = device
+        self._module = module
+
+    def __getattr__(self, name):
+        attr = getattr(self._module, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self._device.run(attr, *args, **kwargs)
+        return method
+
+class AsyncBlocks:
+    ''' Async iterator over stream blocks returned by AsyncADCStream.blocks().
+        Use it as an async context manager so that the stream is stopped as
+        soon as the block exits, even if the loop is left with break; a bare
+        async for only stops it when the iterator is exhausted, closed with
+        aclose() or garbage collected. '''
+    def __init__(self, generator):
+        self._generator = generator
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._generator.__anext__()
+
+    async def aclose(self):
+        ''' Stops reading and, if the iterator started the stream, stops it. '''
+        await self._generator.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+class AsyncADCStream(AsyncModule):
+    def blocks(self, channels=None, scanRate=None, prefetch=2):
+        ''' Returns an async iterator yielding (times, data) for each block of
+            scans, where data is a scans x channels array with skipped scans as
+            NaN and times are datetime64 timestamps, e.g.
+
+                async with lj.adc_stream.blocks(['AIN0'], 1000) as blocks:
+                    async for times, data in blocks:
+                        ...
+
+            If channels are passed the stream is started first and stopped when
+            the iteration ends; otherwise an already running stream is read.
+
+            Reads are issued only while fewer than prefetch blocks are waiting
+            for the consumer. A slow consumer therefore leaves scans in the LJM
+            buffer rather than in memory, and its backlog is reported by LJM
+            (and eventually absorbed by stream auto-recovery) as usual. The
+            blocking reads run on the device's separate stream thread, so other
+            calls to the device are not held up while a read waits for data.
+
+            Args:
+                channels (list): AIN channel names, e.g. ['AIN0', 'AIN1'].
+                scanRate (float): scans per second.
+                prefetch (int): number of blocks read ahead of the consumer.
+        '''
+        return AsyncBlocks(self._blocks(channels, scanRate, prefetch))
+
+    async def _blocks(self, channels, scanRate, prefetch):
+        module = self._module
+        if channels is not None:
+            await self._device.run(module.start, channels, scanRate)
+        queue = asyncio.Queue(maxsize=max(1, prefetch))
+
+        def read():
+            data, device_backlog, backlog = module.labjack.stream.AIn_read()
+            data = np.asarray(data, dtype=float).reshape(-1, len(module.channels))
+            data[data == -9999.0] = np.nan
+            return module.timestamps(len(data), backlog), data
+
+        async def produce():
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    await queue.put(await loop.run_in_executor(self._device.stream_executor, read))
+            except Exception as e:
+                await queue.put(e)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                block = await queue.get()
+                if isinstance(block, Exception):
+                    raise block
+                yield block
+        finally:
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+            if channels is not None:
+                await self._device.run(module.stop)
+
+class AsyncLabJack:
+    ''' asyncio facade over a LabJack. The analog, digital, stream and
+        adc_stream submodules expose the same methods as on LabJack, but as
+        coroutines, e.g.
+
+            lj = await AsyncLabJack.open(devid='470018953')
+            await lj.analog.AOut(0, 1.5)
+            V = await lj.analog.AIn(0)
+
+        Args:
+            labjack (LabJack): an opened device to wrap.
+
+        Attributes:
+            labjack (LabJack): the wrapped synchronous device.
+            executor (ThreadPoolExecutor): single worker thread on which every
+                                           blocking call for this device runs,
+                                           except stream reads.
+            stream_executor (ThreadPoolExecutor): thread for the blocking stream
+                                                  reads of adc_stream.blocks().
+    '''
+    def __init__(self, labjack):
+        self.labjack = labjack
+        self.error = labjack.error
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stream_executor = ThreadPoolExecutor(max_workers=1)
+        self.analog = AsyncModule(self, labjack.analog)
+        self.digital = AsyncModule(self, labjack.digital)
+        self.stream = AsyncModule(self, labjack.stream)
+        self.adc_stream = AsyncADCStream(self, labjack.adc_stream)
+
+    @classmethod
+    async def open(cls, device='ANY', connection='ANY', devid='ANY', backend=None, verbose=True):
+        ''' Opens a LabJack without blocking the event loop. Arguments are as
+            for LabJack; check the error attribute for connection failures. '''
+        loop = asyncio.get_running_loop()
+        labjack = await loop.run_in_executor(None, functools.partial(LabJack, device, connection, devid,
+                                                                     backend=backend, verbose=verbose))
+        return cls(labjack)
+
+    async def run(self, fn, *args, **kwargs):
+        ''' Runs fn(*args, **kwargs) on the device's worker thread and returns
+            its result. Calls run in the order they were submitted. '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def stop(self):
+        await self.run(self.labjack.stop)
+
+    async def close(self):
+        ''' Stops streaming, closes the device and shuts down its worker threads. '''
+        await self.run(self.labjack.close)
+        self.executor.shutdown()
+        self.stream_executor.shutdown()
@@ -0,0 +1,84 @@
+''' Content-addressed cache of compiled stream-out buffers. '''
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+class BufferCache:
+    ''' LRU cache of compiled stream buffers keyed by a hash of their inputs,
+        plus a record of which content is loaded in each STREAM_OUT slot, so
+        that restarting a recent pattern or waveform skips compilation and,
+        if it is still on the device, the upload. Usually accessed as
+        LabJack.buffer_cache.
+
+        Args:
+            max_bytes (int): bound on the total size of the cached arrays.
+
+        Attributes:
+            stats (dict): hits, misses, evictions, uploads_skipped and the
+                          current number of entries and bytes.
+            loaded (dict): STREAM_OUT slot -> description of its content, as
+                           passed to Stream._start.
+    '''
+    def __init__(self, max_bytes=64*2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.loaded = {}
+        self.stats = {'hits': 0,
+                      'misses': 0,
+                      'evictions': 0,
+                      'uploads_skipped': 0,
+                      'entries': 0,
+                      'bytes': 0}
+
+    @staticmethod
+    def key(*parts):
+        ''' Returns a hash of the passed values. Arrays, also inside lists and
+            tuples, are hashed by dtype, shape and content, since their repr
+            is abbreviated; other values are hashed by repr. '''
+        h = hashlib.sha1()
+
+        def update(part):
+            if isinstance(part, np.ndarray):
+                h.update(repr((part.dtype.str, part.shape)).encode())
+                h.update(np.ascontiguousarray(part).tobytes())
+            elif isinstance(part, (list, tuple)):
+                h.update(b'(')
+                for p in part:
+                    update(p)
+                h.update(b')')
+            else:
+                h.update(repr(part).encode())
+            h.update(b'|')
+        for part in parts:
+            update(part)
+        return h.hexdigest()
+
+    def get(self, key, compile):
+        ''' Returns the cached value for key, calling compile() to create it
+            on a miss. The value is a tuple whose array members count towards
+            max_bytes. '''
+        try:
+            value = self.entries[key][0]
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+        except KeyError:
+            pass
+        self.stats['misses'] += 1
+        value = compile()
+        size = sum(v.nbytes for v in value if isinstance(v, np.ndarray))
+        if size <= self.max_bytes:
+            self.entries[key] = (value, size)
+            self.stats['bytes'] += size
+            while self.stats['bytes'] > self.max_bytes:
+                old, (old_value, old_size) = self.entries.popitem(last=False)
+                self.stats['bytes'] -= old_size
+                self.stats['evictions'] += 1
+        self.stats['entries'] = len(self.entries)
+        return value
+
+    def clear(self):
+        ''' Drops all cached buffers and forgets the loaded slot contents. '''
+        self.entries.clear()
+        self.loaded.clear()
+        self.stats['entries'] = self.stats['bytes'] = 0
@@ -1,40 +1,347 @@
 ''' Base LabJack class implementing device connection and communication. '''
-from labjack import ljm
+import re
+import threading
+from contextlib import contextmanager, nullcontext
+from functools import cached_property
 from labyak import Analog, Digital, Temperature, PWM, SPI, I2C, Stream, WaveformGenerator, PatternGenerator, ADCStream
+from labyak.registers import RegisterBatch
+from labyak.buffer_cache import BufferCache
+from labyak.profiler import Profiler, ProfiledLJM
+
+''' Registers never skipped by the shadow cache: writes with side effects
+    (*_GO, STREAM_OUT buffers and loop control, reboot) and registers whose
+    value can change without a write (outputs, DIO states and directions,
+    flash read pointers). '''
+UNSHADOWED = re.compile(r'_GO$|^STREAM_OUT\d+_|^STREAM_ENABLE$|_DATA_(TX|RX)$|_STATE$|'
+                        r'^(DIO|FIO|EIO|CIO|MIO)\d+$|^DIO_DIRECTION$|^T?DAC\d+$|^SYSTEM_REBOOT$|_POINTER$')
 
 class LabJack():
-    def __init__(self, device='ANY', connection='ANY', devid='ANY'):
+    def __init__(self, device='ANY', connection='ANY', devid='ANY', backend=None, verbose=True):
+        ''' Opens a connection to a LabJack.
+
+            Args:
+                device (str): device type, e.g. 'T7', 'T4' or 'ANY'.
+                connection (str): connection type, e.g. 'USB', 'ETHERNET' or 'ANY'.
+                devid (str): serial number, IP address or 'ANY'.
+                backend: an object implementing the labjack.ljm function interface
+                         through which all device communication is routed. Defaults
+                         to labjack.ljm; pass a labyak.simulated.SimulatedLJM to run
+                         without hardware.
+                verbose (bool): print the outcome of the connection attempt. Any
+                                connection error is stored in self.error.
+        '''
+        if backend is None:
+            from labjack import ljm as backend
+        self.ljm = backend
+        self._addresses = {}
+        self._names = {}
+        self._shadow = {}
+        self._local = threading.local()
+        self._profiler = None
+        self.error = None
         try:
-            self.handle = ljm.openS(device,
-                                    connection,
-                                    devid)
-            info = ljm.getHandleInfo(self.handle)
+            self.handle = self.ljm.openS(device,
+                                         connection,
+                                         devid)
+            info = self.ljm.getHandleInfo(self.handle)
 
             self.deviceType = info[0]
-            assert self.deviceType in [ljm.constants.dtT7, ljm.constants.dtT4]
+            self.max_bytes = info[5]
+            assert self.deviceType in [self.ljm.constants.dtT7, self.ljm.constants.dtT4]
+            if hasattr(self.ljm, 'setDeviceReconnectCallback'):
+                self.ljm.setDeviceReconnectCallback(self.handle, lambda handle: self.invalidate())
 
-            print('Connected to LabJack (%i).'%(info[2]))
+            self.serial = info[2]
+            if verbose:
+                print('Connected to LabJack (%i).'%(info[2]))
         except Exception as e:
-            print('Failed to connect to LabJack (%s): %s.'%(devid, e))
-
-        ## load submodules
-        self.analog = Analog(self)
-        self.digital = Digital(self)
-        self.temperature = Temperature(self)
-        self.pwm = PWM(self)
-        self.spi = SPI(self)
-        self.i2c = I2C(self)
-        self.stream = Stream(self)
-        self.waveform = WaveformGenerator(self)
-        self.pattern = PatternGenerator(self)
-        self.adc_stream = ADCStream(self)
+            self.error = e
+            if verbose:
+                print('Failed to connect to LabJack (%s): %s.'%(devid, e))
+
+    ## submodules, created on first access
+    @cached_property
+    def analog(self):
+        return Analog(self)
+
+    @cached_property
+    def digital(self):
+        return Digital(self)
+
+    @cached_property
+    def temperature(self):
+        return Temperature(self)
+
+    @cached_property
+    def pwm(self):
+        return PWM(self)
+
+    @cached_property
+    def spi(self):
+        return SPI(self)
+
+    @cached_property
+    def i2c(self):
+        return I2C(self)
+
+    @cached_property
+    def stream(self):
+        return Stream(self)
+
+    @cached_property
+    def waveform(self):
+        return WaveformGenerator(self)
+
+    @cached_property
+    def pattern(self):
+        return PatternGenerator(self)
+
+    @cached_property
+    def adc_stream(self):
+        return ADCStream(self)
+
+    @cached_property
+    def buffer_cache(self):
+        return BufferCache()
+
+    def profile(self, enabled=True, hook=None):
+        ''' Starts or stops recording the calls, registers, bytes and latency
+            of all device I/O, and the time spent in named sections such as
+            the compilation, upload and start phases of PatternGenerator.start.
+            While disabled, calls go straight to the LJM backend. Statistics
+            accumulate across enable/disable cycles; see stats().
+
+            Args:
+                enabled (bool): turn recording on or off.
+                hook (callable): if given, called with an event dict after every
+                                 LJM call and section, see Profiler.
+        '''
+        if self._profiler is None:
+            self._profiler = Profiler()
+        if hook is not None:
+            self._profiler.hook = hook
+        if enabled and not isinstance(self.ljm, ProfiledLJM):
+            self.ljm = ProfiledLJM(self.ljm, self._profiler, self._names)
+        elif not enabled and isinstance(self.ljm, ProfiledLJM):
+            self.ljm = self.ljm.backend
+
+    def stats(self, reset=False):
+        ''' Returns a snapshot of the statistics recorded since profile() was
+            called: 'ops' maps each LJM function to its calls, bytes, total and
+            maximum latency in seconds and a latency histogram over 'bins';
+            'methods' holds the same per labyak entry point which issued the
+            calls, e.g. 'ADCStream.read' or 'SPI.transfer'; 'sections' holds
+            the same for each named section plus the number and duration of
+            the LJM calls made inside it ('io_calls', 'io_time'); 'registers'
+            counts the accesses to each register. '''
+        if self._profiler is None:
+            self._profiler = Profiler()
+        snapshot = self._profiler.snapshot()
+        if reset:
+            self._profiler.reset()
+        return snapshot
+
+    def _section(self, name):
+        ''' Context manager timing a phase of a submodule method while profiling. '''
+        if not isinstance(self.ljm, ProfiledLJM):
+            return nullcontext()
+        return self._profiler.section(name)
+
+    def _resolve(self, register):
+        ''' Returns the (address, data type) of a register name, cached after the
+            first lookup. '''
+        try:
+            return self._addresses[register]
+        except KeyError:
+            address, dtype = self._addresses[register] = tuple(self.ljm.nameToAddress(register))
+            self._names[address] = register
+            return address, dtype
+
+    def invalidate(self, registers=None):
+        ''' Forgets the last-written values of the passed registers (default all),
+            so that the next write to them is always sent. Called automatically
+            when LJM reconnects to the device and after SYSTEM_REBOOT. Without
+            arguments, the record of loaded STREAM_OUT buffers is also dropped. '''
+        if registers is None:
+            self._shadow.clear()
+            self.buffer_cache.loaded.clear()
+        else:
+            for register in registers:
+                self._shadow.pop(self._resolve(register)[0], None)
+
+    def _unchanged(self, address, value):
+        ''' Checks a single-value write against the shadow cache, updating it.
+            Returns True if the write can be skipped. '''
+        name = self._names.get(address)
+        if name is None or UNSHADOWED.search(name):
+            if name == 'SYSTEM_REBOOT':
+                self.invalidate()
+            return False
+        if address in self._shadow and self._shadow[address] == value:
+            return True
+        if name.endswith('_EF_INDEX'):     ## selecting a feature resets its configuration
+            prefix = name[:-len('INDEX')]
+            for a in [a for a in self._shadow if self._names[a].startswith(prefix)]:
+                del self._shadow[a]
+        self._shadow[address] = value
+        return False
+
+    def compile(self, registers):
+        ''' Returns a RegisterBatch for the passed register names, which can be
+            read or written repeatedly without resolving names again. '''
+        return RegisterBatch(self, registers)
+
+    @contextmanager
+    def batch(self):
+        ''' Queues all register writes made inside the block and sends them in
+            order as the fewest possible packets when the block exits, e.g.
+
+                with labjack.batch():
+                    labjack.analog.AOut(0, 1)
+                    labjack.digital.DOut(3, 1)
+
+            Reads, stream starts and stops inside the block act as ordering
+            barriers: queued writes are sent before them. Call barrier() to force
+            a packet boundary explicitly. Batches may be nested and are local to
+            the calling thread. If the block raises, queued writes are discarded.
+        '''
+        local = self._local
+        outer = getattr(local, 'queue', None) is None
+        if outer:
+            local.queue = []
+        try:
+            yield self
+            if outer:
+                self.barrier()
+        finally:
+            if outer:
+                local.queue = None
+
+    def barrier(self):
+        ''' Sends any writes queued by batch() before continuing. '''
+        queue = getattr(self._local, 'queue', None)
+        if not queue:
+            return
+        self._local.queue = []
+        self._send(queue)
+
+    def _send(self, frames):
+        ''' Sends (address, type, values) write frames in as few packets as
+            possible, skipping single-value writes which the shadow cache shows
+            would not change the register. '''
+        frames = [frame for frame in frames if len(frame[2]) != 1 or not self._unchanged(frame[0], frame[2][0])]
+        try:
+            for packet in self._pack(frames):
+                self.ljm.eAddresses(self.handle, len(packet),
+                                    [frame[0] for frame in packet],
+                                    [frame[1] for frame in packet],
+                                    [1]*len(packet),
+                                    [len(frame[2]) for frame in packet],
+                                    [value for frame in packet for value in frame[2]])
+        except Exception:
+            self.invalidate()    ## unknown which writes arrived
+            raise
+
+    def _pack(self, frames):
+        ''' Splits (address, type, values) write frames into packets that fit the
+            device's maximum packet size, preserving order. Multi-value frames
+            are buffer writes and may be split across packets at any value. '''
+        sizes = {self.ljm.constants.UINT16: 2, self.ljm.constants.BYTE: 1}
+        packets, packet, room = [], [], self.max_bytes - 8
+        for address, dtype, values in frames:
+            size = sizes.get(dtype, 4)
+            i = 0
+            while i < len(values):
+                fit = min(len(values) - i, (room - 4) // size, 510 // size)
+                if fit <= 0:
+                    packets.append(packet)
+                    packet, room = [], self.max_bytes - 8
+                    continue
+                packet.append((address, dtype, values[i:i+fit]))
+                room -= 4 + fit*size
+                i += fit
+        if packet:
+            packets.append(packet)
+        return packets
+
+    def _exchange(self, frames):
+        ''' Executes a mixed list of (address, type, write, values) frames in
+            order, where values is the list to write for a write frame and the
+            number of values to read for a read frame. Frames are grouped into
+            as few packets as possible but never split, so that transactions
+            such as "write data, GO, read result" run exactly as listed.
+            Writes queued by batch() are sent first.
+
+            Returns:
+                list: the values read by each read frame, in order.
+        '''
+        self.barrier()
+        frames = [frame for frame in frames if not frame[2] or len(frame[3]) != 1 or not self._unchanged(frame[0], frame[3][0])]
+        sizes = {self.ljm.constants.UINT16: 2, self.ljm.constants.BYTE: 1}
+        room = self.max_bytes - 8
+        packets, packet, request, response = [], [], 0, 0
+        for frame in frames:
+            address, dtype, write, values = frame
+            size = sizes.get(dtype, 4) * (len(values) if write else values)
+            cost = (4 + size, 0) if write else (4, size)
+            if max(cost) > room:
+                raise ValueError('Frame at address %i does not fit in one packet.'%address)
+            if request + cost[0] > room or response + cost[1] > room:
+                packets.append(packet)
+                packet, request, response = [], 0, 0
+            packet.append(frame)
+            request, response = request + cost[0], response + cost[1]
+        if packet:
+            packets.append(packet)
+
+        reads = []
+        try:
+            for packet in packets:
+                counts = [len(values) if write else values for address, dtype, write, values in packet]
+                results = self.ljm.eAddresses(self.handle, len(packet),
+                                              [frame[0] for frame in packet],
+                                              [frame[1] for frame in packet],
+                                              [int(frame[2]) for frame in packet],
+                                              counts,
+                                              [v for frame, n in zip(packet, counts) for v in (frame[3] if frame[2] else [0]*n)])
+                i = 0
+                for frame, n in zip(packet, counts):
+                    if not frame[2]:
+                        reads.append(results[i:i+n])
+                    i += n
+        except Exception:
+            self.invalidate()    ## unknown which writes arrived
+            raise
+        return reads
+
+    def _read_addresses(self, addresses, types):
+        self.barrier()
+        return self.ljm.eReadAddresses(self.handle, len(addresses), addresses, types)
+
+    def _write_addresses(self, addresses, types, values):
+        ''' Writes values to resolved addresses. All register writes pass through
+            here. '''
+        queue = getattr(self._local, 'queue', None)
+        if queue is not None:
+            queue.extend((address, dtype, [value]) for address, dtype, value in zip(addresses, types, values))
+            return
+        self._send([(address, dtype, [value]) for address, dtype, value in zip(addresses, types, values)])
 
     def _query(self, register):
         ''' Reads the specified register. '''
-        return ljm.eReadName(self.handle, register)
+        address, dtype = self._resolve(register)
+        self.barrier()
+        return self.ljm.eReadAddress(self.handle, address, dtype)
+
+    def _query_many(self, registers):
+        ''' Reads a list of registers in a single call. '''
+        resolved = [self._resolve(register) for register in registers]
+        return self._read_addresses([r[0] for r in resolved], [r[1] for r in resolved])
 
     def _read_array(self, register, num_bytes):
-        return ljm.eReadNameByteArray(self.handle, "I2C_DATA_RX", read_bytes)
+        ''' Reads num_bytes bytes from a buffer register such as SPI_DATA_RX. '''
+        self.barrier()
+        return self.ljm.eReadNameByteArray(self.handle, register, num_bytes)
 
     def _command(self, register, value):
         ''' Writes a value to a specified register.
@@ -43,9 +350,10 @@ class LabJack():
                 register (str): a Modbus register on the LabJack.
                 value: the value to write to the register.
                 '''
-        ljm.eWriteName(self.handle, register, value)
+        address, dtype = self._resolve(register)
+        self._write_addresses([address], [dtype], [value])
 
-    def _write(**kwargs):
+    def _write(self, **kwargs):
         ''' Updates registers according to the passed keyword arguments. For
             example, to set DAC0 to 1 and DAC1 to 0 we would call
                 self._write(DAC0=1, DAC1=0)
@@ -53,7 +361,38 @@ class LabJack():
         self._write_array(list(kwargs.keys()), list(kwargs.values()))
 
     def _write_array(self, registers, values):
-        ljm.eWriteNames(self.handle, len(registers), registers, values)
+        resolved = [self._resolve(register) for register in registers]
+        self._write_addresses([r[0] for r in resolved], [r[1] for r in resolved], list(values))
+
+    def _write_buffer(self, register, values):
+        ''' Writes an array of values to a buffer register such as
+            STREAM_OUT0_BUFFER_F32. The register is resolved to an address once
+            and the values are sent in chunks filling the device's maximum
+            packet size.
+
+            Args:
+                register (str): name of the buffer register.
+                values (array): NumPy array or list of values.
+        '''
+        address, dtype = self._resolve(register)
+        queue = getattr(self._local, 'queue', None)
+        if queue is not None:
+            queue.append((address, dtype, values))
+            return
+        chunk = self._values_per_packet(dtype)
+        for i in range(0, len(values), chunk):
+            block = values[i:i+chunk]
+            self.ljm.eWriteAddressArray(self.handle, address, dtype, len(block), block)
+
+    def _values_per_packet(self, dtype):
+        ''' Returns how many values of the given LJM data type fit in one Modbus
+            feedback packet. Each packet carries an 8-byte header and each frame
+            a 4-byte header plus at most 255 registers. '''
+        size = {self.ljm.constants.UINT16: 2, self.ljm.constants.BYTE: 1}.get(dtype, 4)
+        payload = self.max_bytes - 8
+        per_frame = min(510 // size, (payload - 4) // size)
+        frames = payload // (4 + size*per_frame)
+        return max(1, frames * per_frame)
 
     def _write_dict(self, d):
         ''' Writes values to registers according to the passed dictionary. '''
@@ -61,10 +400,16 @@ class LabJack():
 
     def stop(self):
         ''' Stop streaming if currently running '''
+        self.barrier()
         try:
-            ljm.eStreamStop(self.handle)
+            self.ljm.eStreamStop(self.handle)
         except:
             pass
 
+    def close(self):
+        ''' Stops streaming and closes the connection. '''
+        self.stop()
+        self.ljm.close(self.handle)
+
 if __name__ == '__main__':
     lj = LabJack(devid='470018953')
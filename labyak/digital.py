@@ -1,10 +1,15 @@
-from labjack import ljm
 import numpy as np
 
 class Digital():
     ''' Handles digital subsystems of the LabJack T-series device family, covering
         digital in/out, simultaneous DIO_STATE updates, and streaming.
     '''
+    ''' Stream-writable port registers as (address, first DIO line, number of lines). '''
+    PORTS = {'FIO_STATE': (2500, 0, 8),
+             'EIO_STATE': (2501, 8, 8),
+             'CIO_STATE': (2502, 16, 4),
+             'MIO_STATE': (2503, 20, 3)}
+
     def __init__(self, labjack):
         self.labjack = labjack
 
@@ -43,19 +48,45 @@ class Digital():
                 inhibit += '1'
         return inhibit
 
+    @staticmethod
+    def ports(channels):
+        ''' Returns the names of the digital port registers (FIO_STATE, EIO_STATE,
+            CIO_STATE, MIO_STATE) containing the passed DIO channels, in address order. '''
+        return [port for port, (address, first, width) in Digital.PORTS.items()
+                if any(first <= ch < first+width for ch in channels)]
+
     @staticmethod
     def array_to_bitmask(arr, channels):
-        ''' Convert multidimensional array with one column for each channel to an array of bitmasks. '''
-        y = np.zeros(len(arr))
-
-        inhibit = 0x7FFFFF-Digital.bitmask(channels)
-        inhibit_string = Digital.inhibit_string(channels)
-        for i in range(len(arr)):
-            states = arr[i,:]
-            bitmask = Digital.state(channels, states)
-            lower_bits = format(bitmask, '#010b')
-            y[i] = int(inhibit_string[-8:]+lower_bits[2:], 2)
-        return y
+        ''' Convert multidimensional array with one column for each channel to
+            U16 stream words for the port registers returned by Digital.ports().
+
+            Each word holds the channel states in its lower byte and an inhibit
+            mask in its upper byte, so that lines of the port which are not in
+            channels are left untouched when the word is written.
+
+            Args:
+                arr (array): samples x channels array of 0/1 states.
+                channels (list): DIO numbers corresponding to the columns of arr.
+
+            Returns:
+                words (ndarray): uint16 array with one row per sample and one column
+                                 per port, e.g. FIO_STATE alone for channels 0-7.
+        '''
+        arr = np.asarray(arr)
+        if arr.ndim == 1:
+            arr = arr.reshape(-1, 1)
+        channels = np.asarray(channels)
+        states = arr.astype(np.uint16)
+
+        ports = Digital.ports(channels)
+        words = np.empty((len(arr), len(ports)), dtype=np.uint16)
+        for j, port in enumerate(ports):
+            address, first, width = Digital.PORTS[port]
+            cols = np.flatnonzero((channels >= first) & (channels < first+width))
+            shifts = (channels[cols] - first).astype(np.uint16)
+            inhibit = ((1 << width) - 1) & ~Digital.bitmask([ch-first for ch in channels[cols]])
+            words[:, j] = np.bitwise_or.reduce(states[:, cols] << shifts, axis=1) | (inhibit << 8)
+        return words
 
     @staticmethod
     def bitmask(channels):
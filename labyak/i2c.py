@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
-from labjack import ljm
 
 class I2C:
+    ''' Largest number of bytes in one I2C transaction (I2C_DATA_TX/RX). '''
+    MAX_BYTES = 56
+
     def __init__(self, labjack):
         self.labjack = labjack
+        self.registers = {}     ## (addr, reg) -> last byte read or written, see read(cached=True)
 
     def initialize(self, sda=13, scl=12, speed=65516, options=2):
         ''' Set up I2C on a pair of FIO channels.
@@ -20,32 +23,112 @@ class I2C:
                                   'I2C_SPEED_THROTTLE': speed,
                                   'I2C_OPTIONS': options})
 
-    def read(self, addr, reg, read_bytes):
-        # Set the TX bytes. We are sending 1 byte for the address.
-        buffer = [reg]
-        self.labjack._write_dict({'I2C_SLAVE_ADDRESS': addr,
-                                  'I2C_NUM_BYTES_TX': len(buffer),
-                                  'I2C_NUM_BYTES_RX': read_bytes,
-                                  })
-        self.labjack._write_array('I2C_DATA_TX', buffer)
-        self.labjack._write('I2C_GO', 1)
+    def _chunk(self, read):
+        ''' Data bytes per transaction: the I2C buffer, or less if the frames
+            would not fit in one packet. Reads are limited by the response
+            (I2C_ACKS and I2C_DATA_RX), writes by the request (setup frames,
+            I2C_DATA_TX with the register byte, GO and the read requests). '''
+        room = self.labjack.max_bytes - 8
+        if read:
+            return min(self.MAX_BYTES, room - 4)
+        return min(self.MAX_BYTES, room - 7*4 - 4*2) - 1
+
+    def _frames(self, addr, tx, read_bytes):
+        ''' Returns the frames of one transaction: setup, data, GO, then reads
+            of I2C_ACKS and, if read_bytes, I2C_DATA_RX. '''
+        constants = self.labjack.ljm.constants
+        r = lambda name: self.labjack._resolve(name)[0]
+        frames = [(r('I2C_SLAVE_ADDRESS'), constants.UINT16, True, [addr]),
+                  (r('I2C_NUM_BYTES_TX'), constants.UINT16, True, [len(tx)]),
+                  (r('I2C_NUM_BYTES_RX'), constants.UINT16, True, [read_bytes])]
+        if len(tx):
+            frames.append((r('I2C_DATA_TX'), constants.BYTE, True, list(tx)))
+        frames += [(r('I2C_GO'), constants.UINT16, True, [1]),
+                   (r('I2C_ACKS'), constants.UINT32, False, 1)]
+        if read_bytes:
+            frames.append((r('I2C_DATA_RX'), constants.BYTE, False, read_bytes))
+        return frames
+
+    def _transactions(self, requests):
+        ''' Runs (addr, tx, read_bytes) transactions with as few round trips as
+            possible and returns the bytes read by each. Raises IOError if a
+            device does not acknowledge its address. '''
+        frames = [f for addr, tx, n in requests for f in self._frames(addr, tx, n)]
+        reads = iter(self.labjack._exchange(frames))
+        results = []
+        for addr, tx, n in requests:
+            acks = int(next(reads)[0])
+            if not acks & 1:
+                raise IOError('No acknowledgement from I2C device 0x%02x.'%addr)
+            results.append([int(b) for b in next(reads)] if n else [])
+        return results
+
+    def read(self, addr, reg, read_bytes, cached=False):
+        ''' Reads read_bytes consecutive registers starting at reg, splitting
+            long bursts into transactions which fit the I2C buffer and one packet.
+
+            Args:
+                addr (int): 7-bit device address.
+                reg (int): first register.
+                read_bytes (int): number of registers to read.
+                cached (bool): return previously read or written values from
+                               self.registers when all are known, and remember
+                               the result otherwise. Use for registers which
+                               only change when written, like configuration.
+        '''
+        return self.read_many([(addr, reg, read_bytes)], cached=cached)[0]
 
-        return self.labjack._read_array('I2C_DATA_RX', read_bytes)
+    def read_many(self, requests, cached=False):
+        ''' Performs several burst reads, given as (addr, reg, read_bytes), with
+            as few round trips as possible and returns a list of byte lists. '''
+        chunk = self._chunk(read=True)
+        results = [None]*len(requests)
+        pending = []
+        for i, (addr, reg, n) in enumerate(requests):
+            keys = [(addr, reg+j) for j in range(n)]
+            if cached and all(key in self.registers for key in keys):
+                results[i] = [self.registers[key] for key in keys]
+            else:
+                pending.append(i)
+        transactions = [(requests[i][0], [requests[i][1]+j], min(chunk, requests[i][2]-j))
+                        for i in pending for j in range(0, requests[i][2], chunk)]
+        data = iter(self._transactions(transactions))
+        for i in pending:
+            addr, reg, n = requests[i]
+            results[i] = [b for j in range(0, n, chunk) for b in next(data)]
+            if cached:
+                self.registers.update({(addr, reg+j): b for j, b in enumerate(results[i])})
+        return results
 
     def write(self, addr, reg, data):
-        buffer = [reg]
-        buffer.extend(data)
-        self.labjack._write_dict({'I2C_SLAVE_ADDRESS': addr,
-                                  'I2C_NUM_BYTES_TX': len(buffer),
-                                  'I2C_NUM_BYTES_RX': 0,
-                                  })
-        self.labjack._write_array('I2C_DATA_TX', buffer)
-        self.labjack._write('I2C_GO', 1)
+        ''' Writes data to consecutive registers starting at reg. '''
+        self.write_many([(addr, reg, data)])
+
+    def write_many(self, requests):
+        ''' Performs several writes, given as (addr, reg, data), with as few
+            round trips as possible. Cached register values are updated. '''
+        chunk = self._chunk(read=False)
+        transactions = [(addr, [reg+j] + list(data[j:j+chunk]), 0)
+                        for addr, reg, data in requests for j in range(0, len(data), chunk)]
+        self._transactions(transactions)
+        for addr, reg, data in requests:
+            for j, b in enumerate(data):
+                if (addr, reg+j) in self.registers:
+                    self.registers[(addr, reg+j)] = b
+
+    def invalidate(self, addr=None):
+        ''' Forgets cached register values of one device (default all). '''
+        for key in [key for key in self.registers if addr is None or key[0] == addr]:
+            del self.registers[key]
 
     def check(self, addr):
         ''' Query whether the target addr is an I2C channel '''
-        self.labjack._write_dict({'I2C_SLAVE_ADDRESS': addr,
-                                  'I2C_NUM_BYTES_TX': 0,
-                                  'I2C_NUM_BYTES_RX': 0,
-                                  })
-        return self.labjack._query('I2C_ACKS') == 1
+        return self.scan([addr]) == [addr]
+
+    def scan(self, addresses=range(0x08, 0x78)):
+        ''' Returns the addresses, by default all non-reserved 7-bit ones, which
+            acknowledge an empty transaction. All probes share as few packets as
+            possible. '''
+        frames = [f for addr in addresses for f in self._frames(addr, [], 0)]
+        acks = self.labjack._exchange(frames)
+        return [addr for addr, ack in zip(addresses, acks) if int(ack[0]) & 1]
@@ -2,60 +2,136 @@
     channels with periods as short as 80 us/12.5 kHz. Faster speeds (up to 100 kHz
     for a single channel) could be achieved by writing to specific DIO registers
     rather than the shared FIO_STATE register. '''
-from labjack import ljm
 import numpy as np
+from labyak.digital import Digital
+from labyak.stream import Stream
 
 class PatternGenerator:
     def __init__(self, labjack):
         self.labjack = labjack
+        self.scanRate = None    ## set by start(), required by update()
 
     def optimize_stream(self, sequence, period, max_samples = 8191):
         ''' Converts a sequence to a stream. The LabJack has two limitations:
-            a maximum stream rate of 100 kS/s and a maximum sample count of
-            2^13-1. This method computes a cutoff period based on these two
-            restrictions; above the cutoff, the speed will be lowered to accommodate
-            longer sequences with equal numbers of samples, while below the cutoff,
-            the number of samples will be lowered while the speed is kept at max.
+            a maximum stream rate of 100 kS/s (40 kS/s on the T4) shared between
+            the digital ports in use, and a maximum sample count of 2^13-1.
+
+            Within these limits the scan rate is chosen as the stream clock
+            divided by an integer number of ticks which evenly divides every
+            edge time and the period, so that all edges fall exactly on sample
+            boundaries; the largest such divisor is used to keep the buffer
+            short. If no such rate exists, the rate with the smallest worst-case
+            edge error is used instead. In both cases the worst-case error in
+            seconds is stored in self.timing_error. If max_samples is None, the
+            sample count is unlimited, as for continuous output, but the largest
+            exact divisor is still chosen, i.e. the slowest exact scan rate
+            rather than the maximum one.
 
             Args:
-                sequence (dict)
+                sequence (dict): DIO channel -> list of (time, state) edges.
                 period (float): The total sequence duration.
+                max_samples (int): maximum number of samples in the stream.
 
             Returns:
-                stream (array): A list of points which will be output at the calculated sampling rate.
+                stream (array): samples x channels array of states which will be
+                                output at the calculated sampling rate.
                 speed (float): Stream rate in samples/second.
         '''
-        ''' Compute optimum scan rate and number of samples '''
-        if self.labjack.deviceType == ljm.constants.dtT7:
-            max_speed = 100000
-        elif self.labjack.deviceType == ljm.constants.dtT4:
-            max_speed = 40000
+        max_speed = self.labjack.stream.max_speed()
+        max_speed /= len(Digital.ports(sequence))    ## one stream-out per digital port
 
-        cutoff = max_samples / max_speed
-        if period >= cutoff:
-            samples = max_samples
-            scanRate = int(samples/period)
+        column, edges, ticks, period_ticks = self._edges(sequence, period)
+        lo = int(np.ceil(Stream.CLOCK / max_speed))
+        if max_samples is not None:
+            lo = max(lo, int(np.ceil(period_ticks / max_samples)))
+        divisors = Stream.divisors(np.gcd.reduce(np.append(ticks, period_ticks)), lo, Stream.CLOCK)
+        if len(divisors):
+            divisor = int(divisors[-1])
         else:
-            scanRate = max_speed
-            samples = int(period*scanRate)
+            divisor = Stream.nearest_divisor(ticks, period_ticks, lo, max_samples)
+        return self._fill(column, edges, ticks, period_ticks, divisor, len(sequence)), Stream.CLOCK / divisor
+
+    def _edges(self, sequence, period):
+        ''' Flattens a sequence to the column and (time, state) of each edge and
+            converts the edge times and period to stream clock ticks. '''
+        channels = list(sequence)
+        column = np.concatenate([np.full(len(sequence[ch]), j) for j, ch in enumerate(channels)]).astype(int)
+        edges = np.array([point for ch in channels for point in sequence[ch]], dtype=float).reshape(-1, 2)
+        ticks = np.round(edges[:, 0] * Stream.CLOCK).astype(np.int64)
+        return column, edges, ticks, int(round(period * Stream.CLOCK))
+
+    def _fill(self, column, edges, ticks, period_ticks, divisor, channels):
+        ''' Builds the samples x channels state array for a given number of
+            clock ticks per sample and stores the worst-case timing error. '''
+        samples = max(1, int(round(period_ticks / divisor)))
+        index = np.round(ticks / divisor).astype(np.int64)
+        self.timing_error = max(np.abs(index*divisor - ticks).max(initial=0),
+                                abs(samples*divisor - period_ticks)) / Stream.CLOCK
+
+        ''' Fill each column from its sorted edges: every sample takes the state
+            of the last edge at or before it. '''
+        stream = np.zeros((samples, channels), dtype=np.uint8)
+        order = np.lexsort((index, column))    ## stable: later edges at the same sample win
+        for j in range(channels):
+            rows = order[column[order] == j]
+            last = np.searchsorted(index[rows], np.arange(samples), side='right') - 1
+            states = np.append(edges[rows, 1], 0).astype(np.uint8)    ## index -1 -> low before the first edge
+            stream[:, j] = states[last]
+        return stream
+
+    def start(self, sequence, period, continuous=False, updatable=False):
+        ''' Outputs a looped sequence. If continuous is True, the sequence is
+            compiled at the maximum scan rate regardless of length and fed to the
+            device from a background thread; the StreamFeeder is returned.
+            Compiled patterns are cached in LabJack.buffer_cache, and restarting
+            the pattern which is already loaded skips the upload. If updatable
+            is True, the loop is limited to Stream.MAX_UPDATABLE samples so that
+            update() can replace it. '''
+        with self.labjack._section('pattern.start'):
+            channels = list(sequence.keys())
+            ports = self.labjack.digital.ports(channels)
+            max_samples = None if continuous else Stream.MAX_UPDATABLE if updatable else 8191
+
+            def compile():
+                with self.labjack._section('compile'):
+                    data, scanRate = self.optimize_stream(sequence, period, max_samples=max_samples)
+                    return self.labjack.digital.array_to_bitmask(data, channels), scanRate, self.timing_error
+            edges = [(ch, np.asarray(sequence[ch], dtype=float)) for ch in channels]
+            key = self.labjack.buffer_cache.key('pattern', edges, period, max_samples, self.labjack.deviceType)
+            data, scanRate, self.timing_error = self.labjack.buffer_cache.get(key, compile)
+            with self.labjack.batch():
+                self.labjack.stream.configure()
+                self.labjack.stream.set_trigger(self.labjack.stream.trigger)
+                self.labjack.stream.set_inhibit(channels)
+                if continuous:
+                    targets = [Digital.PORTS[port][0] for port in ports]
+                    return self.labjack.stream.feed(targets, data, scanRate, dtype='U16', loop=True)
+                self.scanRate = self.labjack.stream.DOut(data, scanRate, loop=1, ports=ports, key=key)
+            self.ports = ports
 
-        ''' Resample to array format '''
-        stream = np.zeros((int(samples), len(sequence)))
-        j=0
-        for channel in sequence:
-            for point in sequence[channel]:
-                t = point[0]
-                V = point[1]
-                stream[int(t/period*samples)::, j] = V
-            j += 1
-        return stream, scanRate
+    def update(self, sequence, period, wait=False):
+        ''' Replaces the pattern started with start() at its next loop boundary,
+            without stopping the stream, so that the output has no gap. The new
+            sequence must use the same digital ports and is compiled at the
+            running scan rate; see self.timing_error for the resulting error.
 
-    def start(self, sequence, period):
-        data, scanRate = self.optimize_stream(sequence, period)
-        data = self.labjack.digital.array_to_bitmask(data, list(sequence.keys()))
-        self.labjack.stream.configure()
-        self.labjack.stream.set_inhibit(list(sequence.keys()))
-        self.labjack.stream.DOut(data, scanRate, loop=1)
+            Args:
+                sequence (dict): DIO channel -> list of (time, state) edges.
+                period (float): The total sequence duration.
+                wait (bool): block until the device has switched to the new data.
+
+            Returns:
+                metrics (dict): update latency, see Stream.update.
+        '''
+        if self.scanRate is None:
+            raise RuntimeError('No pattern is running; call start() first.')
+        channels = list(sequence.keys())
+        if Digital.ports(channels) != self.ports:
+            raise ValueError('An update must use the same digital ports as the running pattern.')
+        column, edges, ticks, period_ticks = self._edges(sequence, period)
+        data = self._fill(column, edges, ticks, period_ticks, int(round(Stream.CLOCK / self.scanRate)), len(channels))
+        data = self.labjack.digital.array_to_bitmask(data, channels)
+        return self.labjack.stream.update(data, dtype='U16', wait=wait)
 
     def stream_raw(self, channel, sequence, scanRate, loop=True):
         ''' A lower level single-channel streaming alternative to the start() method allowing the
@@ -63,6 +139,8 @@ class PatternGenerator:
             generated from a list of timestamps. Avoids possible timing inaccuracies
             introduced by the optimize_stream method. '''
         data = self.labjack.digital.array_to_bitmask(np.vstack(sequence), [channel])
-        self.labjack.stream.configure()
-        self.labjack.stream.set_inhibit([channel])
-        self.labjack.stream.DOut(data, scanRate, loop=loop)
+        with self.labjack.batch():
+            self.labjack.stream.configure()
+            self.labjack.stream.set_trigger(self.labjack.stream.trigger)
+            self.labjack.stream.set_inhibit([channel])
+            self.labjack.stream.DOut(data, scanRate, loop=loop, ports=self.labjack.digital.ports([channel]))
@@ -0,0 +1,96 @@
+''' Concurrent management of several LabJacks. '''
+from concurrent.futures import ThreadPoolExecutor
+from labyak.core import LabJack
+
+class LabJackPool:
+    ''' Opens a group of devices concurrently and fans operations out to all of
+        them on a thread pool. Errors are collected per device instead of being
+        printed or raised.
+
+        Args:
+            devids (list): serial numbers or IP addresses of the devices.
+            device (str): device type passed to each LabJack, e.g. 'T7'.
+            connection (str): connection type passed to each LabJack.
+            backend: LJM backend shared by all devices (see LabJack).
+            max_workers (int): size of the thread pool; defaults to one per device.
+
+        Attributes:
+            devices (dict): devid -> LabJack for each device that opened.
+            errors (dict): devid -> exception from the most recent operation
+                           (including opening) that failed on that device.
+    '''
+    def __init__(self, devids, device='ANY', connection='ANY', backend=None, max_workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(devids)))
+        self.devices = {}
+        self.errors = {}
+        labjacks = self._run({devid: devid for devid in devids},
+                             lambda devid: LabJack(device, connection, devid, backend=backend, verbose=False))
+        for devid, lj in labjacks.items():
+            if lj.error is None:
+                self.devices[devid] = lj
+            else:
+                self.errors[devid] = lj.error
+
+    def _run(self, targets, fn):
+        ''' Calls fn on each value of targets concurrently; returns results by key
+            and records exceptions in self.errors. '''
+        futures = {key: self.executor.submit(fn, target) for key, target in targets.items()}
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+                self.errors.pop(key, None)
+            except Exception as e:
+                self.errors[key] = e
+        return results
+
+    def __getitem__(self, devid):
+        return self.devices[devid]
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __len__(self):
+        return len(self.devices)
+
+    def map(self, fn):
+        ''' Calls fn(labjack) on every device in parallel and returns a dict of
+            results by devid. Failures are recorded in self.errors. '''
+        return self._run(self.devices, fn)
+
+    def configure(self, registers):
+        ''' Writes the same register dictionary to every device in parallel. '''
+        return self.map(lambda lj: lj._write_dict(registers))
+
+    def stop(self):
+        ''' Stops streaming on every device in parallel. '''
+        return self.map(lambda lj: lj.stop())
+
+    def start_synchronized(self, trigger_channel, start):
+        ''' Arms every device to begin streaming on an edge at DIO trigger_channel,
+            then calls start(labjack) on each in parallel, e.g.
+                pool.start_synchronized(0, lambda lj: lj.adc_stream.start(['AIN0'], 1000))
+            The streams are configured and waiting when this returns; they all
+            begin on the shared hardware trigger, which can be pulsed with fire().
+            Devices which failed to arm are listed in self.errors.
+        '''
+        def arm(lj):
+            lj.stream.arm(trigger_channel)
+            try:
+                return start(lj)
+            finally:
+                lj.stream.arm(None)
+        return self.map(arm)
+
+    def fire(self, devid, channel):
+        ''' Pulses DIO channel on one device, for a trigger line wired to the
+            trigger inputs of the whole group. '''
+        lj = self.devices[devid]
+        lj.digital.DOut(channel, 0)
+        lj.digital.DOut(channel, 1)
+        lj.digital.DOut(channel, 0)
+
+    def close(self):
+        ''' Closes all devices and shuts down the thread pool. '''
+        self.map(lambda lj: lj.close())
+        self.executor.shutdown()
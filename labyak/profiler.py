@@ -0,0 +1,203 @@
+''' Optional counting and timing of the LJM calls made by a LabJack. '''
+import bisect
+import copy
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+''' Upper edges in seconds of the latency histogram bins; a last bin counts
+    anything slower. '''
+LATENCY_BINS = [1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1, 3e-1, 1]
+
+class Profiler:
+    ''' Accumulates call counts, registers, bytes and latency histograms per
+        LJM function and per labyak method which issued the call, such as
+        'ADCStream.read' or 'I2C.read_many', and wall time per named section
+        such as 'pattern.start/compile'. Created by LabJack.profile() and read
+        through LabJack.stats().
+
+        Args:
+            hook (callable): optional function called with an event dict after
+                             every LJM call ('kind': 'call') and section
+                             ('kind': 'section'). It runs on the calling thread
+                             and should return quickly.
+    '''
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.ops = {}
+            self.methods = {}
+            self.sections = {}
+            self.registers = {}
+
+    @staticmethod
+    def _entry():
+        return {'calls': 0, 'bytes': 0, 'time': 0.0, 'max': 0.0, 'histogram': [0]*(len(LATENCY_BINS)+1)}
+
+    @staticmethod
+    def _add(entry, latency, nbytes=0):
+        entry['calls'] += 1
+        entry['bytes'] += nbytes
+        entry['time'] += latency
+        entry['max'] = max(entry['max'], latency)
+        entry['histogram'][bisect.bisect_left(LATENCY_BINS, latency)] += 1
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def record(self, op, registers, nbytes, latency, method=None):
+        ''' Accounts for one LJM call, attributing it to the method which
+            issued it and to every active section of the calling thread. '''
+        stack = self._stack()
+        paths = ['/'.join(stack[:i+1]) for i in range(len(stack))]
+        section = paths[-1] if paths else None
+        with self.lock:
+            self._add(self.ops.setdefault(op, self._entry()), latency, nbytes)
+            if method is not None:
+                self._add(self.methods.setdefault(method, self._entry()), latency, nbytes)
+            for register in registers:
+                self.registers[register] = self.registers.get(register, 0) + 1
+            for path in paths:
+                entry = self.sections[path]
+                entry['io_calls'] += 1
+                entry['io_time'] += latency
+                entry['bytes'] += nbytes
+        if self.hook is not None:
+            self.hook({'kind': 'call', 'name': op, 'registers': registers, 'bytes': nbytes,
+                       'latency': latency, 'section': section, 'method': method})
+
+    @contextmanager
+    def section(self, name):
+        ''' Times the enclosed block as name, nested under any enclosing
+            sections of the same thread. '''
+        stack = self._stack()
+        stack.append(name)
+        path = '/'.join(stack)
+        with self.lock:
+            if path not in self.sections:
+                self.sections[path] = dict(self._entry(), io_calls=0, io_time=0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency = time.perf_counter() - start
+            stack.pop()
+            with self.lock:
+                entry = self.sections[path]
+                self._add(entry, latency)
+            if self.hook is not None:
+                self.hook({'kind': 'section', 'name': path, 'latency': latency})
+
+    def snapshot(self):
+        ''' Returns a copy of the accumulated statistics. '''
+        with self.lock:
+            return {'ops': copy.deepcopy(self.ops),
+                    'methods': copy.deepcopy(self.methods),
+                    'sections': copy.deepcopy(self.sections),
+                    'registers': dict(self.registers),
+                    'bins': list(LATENCY_BINS)}
+
+class ProfiledLJM:
+    ''' Stand-in for an LJM backend which times and counts the device I/O calls
+        and passes everything else through unchanged. '''
+    CALLS = {'eReadAddress', 'eReadAddresses', 'eWriteAddress', 'eWriteAddresses', 'eAddresses',
+             'eReadAddressArray', 'eWriteAddressArray', 'eReadName', 'eReadNames', 'eWriteName',
+             'eWriteNames', 'eReadNameByteArray', 'eWriteNameByteArray', 'eStreamStart',
+             'eStreamRead', 'eStreamStop'}
+
+    @staticmethod
+    def caller(frame):
+        ''' Returns 'Class.method' of the outermost labyak function on the
+            stack above frame, i.e. the entry point the user called. '''
+        method = None
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if module.startswith('labyak.') and module != __name__:
+                owner = frame.f_locals.get('self')
+                owner = type(owner).__name__ if owner is not None else module.rsplit('.', 1)[1]
+                method = '%s.%s'%(owner, frame.f_code.co_name)
+            frame = frame.f_back
+        return method
+
+    def __init__(self, backend, profiler, names):
+        self.backend = backend
+        self.profiler = profiler
+        self.names = names
+        self.sizes = {backend.constants.UINT16: 2, backend.constants.BYTE: 1}
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if name not in self.CALLS:
+            return attr
+        describe = getattr(self, '_' + name)
+
+        def call(*args):
+            start = time.perf_counter()
+            try:
+                result = attr(*args)
+            except Exception:
+                self.profiler.record(name, [], 0, time.perf_counter() - start, self.caller(sys._getframe(1)))
+                raise
+            latency = time.perf_counter() - start
+            registers, nbytes = describe(args, result)
+            self.profiler.record(name, [self.names.get(r, r) for r in registers], nbytes, latency,
+                                 self.caller(sys._getframe(1)))
+            return result
+        self.__dict__[name] = call
+        return call
+
+    def _size(self, dtype):
+        return self.sizes.get(dtype, 4)
+
+    ## (registers, bytes) of each call from its arguments and result
+    def _eReadAddress(self, args, result):
+        return [args[1]], self._size(args[2])
+
+    _eWriteAddress = _eReadAddress
+
+    def _eReadAddresses(self, args, result):
+        return list(args[2]), sum(self._size(t) for t in args[3])
+
+    _eWriteAddresses = _eReadAddresses
+
+    def _eAddresses(self, args, result):
+        return list(args[2]), sum(self._size(t)*n for t, n in zip(args[3], args[5]))
+
+    def _eReadAddressArray(self, args, result):
+        return [args[1]], self._size(args[2])*args[3]
+
+    _eWriteAddressArray = _eReadAddressArray
+
+    def _eReadName(self, args, result):
+        return [args[1]], 4
+
+    _eWriteName = _eReadName
+
+    def _eReadNames(self, args, result):
+        return list(args[2]), 4*args[1]
+
+    _eWriteNames = _eReadNames
+
+    def _eReadNameByteArray(self, args, result):
+        return [args[1]], args[2]
+
+    _eWriteNameByteArray = _eReadNameByteArray
+
+    def _eStreamStart(self, args, result):
+        return list(args[3]), 0
+
+    def _eStreamRead(self, args, result):
+        return [], 2*len(result[0])
+
+    def _eStreamStop(self, args, result):
+        return [], 0
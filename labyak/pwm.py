@@ -1,6 +1,7 @@
 class PWM:
     def __init__(self, labjack):
         self.labjack = labjack
+        self.batches = {}
 
     def start(self, channel, frequency, duty_cycle):
         ''' Starts pulse width modulation on an FIO channel.
@@ -11,26 +12,22 @@ class PWM:
                 duty_cycle (float): duty cycle between 0 and 1.
         '''
         roll_value = 80e6 / frequency
-        config = {
-            "DIO_EF_CLOCK0_ENABLE": 0,
-            "DIO_EF_CLOCK0_DIVISOR": 1,
-            "DIO_EF_CLOCK0_ROLL_VALUE": roll_value,
-        }
-        self.labjack._write_dict(config)
-
-        config = {
-            "DIO_EF_CLOCK0_ENABLE": 1,
-            "DIO%i_EF_ENABLE"%channel: 0,
-            "DIO%i_EF_INDEX"%channel: 0,
-            "DIO%i_EF_OPTIONS"%channel: 0,
-            "DIO%i_EF_CONFIG_A"%channel: duty_cycle * roll_value,
-        }
-        self.labjack._write_dict(config)
-
-        config = {
-            "DIO%i_EF_ENABLE"%channel: 1
-        }
-        self.labjack._write_dict(config)
+        batches = self.batches.get(channel)
+        if batches is None:
+            batches = self.batches[channel] = (
+                    self.labjack.compile(["DIO_EF_CLOCK0_ENABLE",
+                                          "DIO_EF_CLOCK0_DIVISOR",
+                                          "DIO_EF_CLOCK0_ROLL_VALUE"]),
+                    self.labjack.compile(["DIO_EF_CLOCK0_ENABLE",
+                                          "DIO%i_EF_ENABLE"%channel,
+                                          "DIO%i_EF_INDEX"%channel,
+                                          "DIO%i_EF_OPTIONS"%channel,
+                                          "DIO%i_EF_CONFIG_A"%channel]),
+                    self.labjack.compile(["DIO%i_EF_ENABLE"%channel]))
+        with self.labjack.batch():
+            batches[0].write([0, 1, roll_value])
+            batches[1].write([1, 0, 0, 0, duty_cycle * roll_value])
+            batches[2].write([1])
 
     def stop(self, channel):
-        self._command("DIO%i_EF_ENABLE"%channel, 0)
+        self.labjack._command("DIO%i_EF_ENABLE"%channel, 0)
@@ -0,0 +1,143 @@
+''' Append-only on-disk storage for long streams. A recording is a directory of
+    fixed-size .npy segments plus a small text index:
+
+        recording/
+            meta.json           channels, scan rate, start time, segment size
+            index.txt           one line per completed segment: name first_scan scans
+            seg_000000.npy      scans x channels float32 arrays
+            ...
+
+    Writing costs O(block): blocks are copied into the memory-mapped current
+    segment and an index line is appended when a segment is closed. Reading
+    memory-maps only the segments overlapping the requested time range. '''
+import json
+import os
+import numpy as np
+
+class StreamRecorder:
+    ''' Writes stream blocks to a recording directory.
+
+        Args:
+            path (str): directory to create.
+            channels (list): channel names.
+            scanRate (float): scans per second.
+            start_time (datetime64): time of scan 0, or None if not yet known;
+                                     see anchor().
+            segment_scans (int): scans per segment file.
+    '''
+    def __init__(self, path, channels, scanRate, start_time, segment_scans=1000000, dtype='float32'):
+        self.path = path
+        self.channels = list(channels)
+        self.segment_scans = int(segment_scans)
+        self.dtype = dtype
+        self.scanRate = scanRate
+        os.makedirs(path, exist_ok=False)
+        self.anchor(start_time)
+        self.index = open(os.path.join(path, 'index.txt'), 'a')
+        self.segment = None
+        self.segment_number = 0
+        self.segment_first = 0
+        self.position = 0
+        self.total = 0
+
+    def anchor(self, start_time):
+        ''' Sets the time of scan 0 and rewrites meta.json. '''
+        self.start_time = start_time
+        meta = {'channels': self.channels,
+                'scanRate': self.scanRate,
+                'start_time_ns': int(np.datetime64(start_time, 'ns').astype(np.int64)) if start_time is not None else None,
+                'segment_scans': self.segment_scans,
+                'dtype': self.dtype}
+        with open(os.path.join(self.path, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+    def _open_segment(self):
+        name = 'seg_%06i.npy'%self.segment_number
+        self.segment_name = name
+        self.segment = np.lib.format.open_memmap(os.path.join(self.path, name), mode='w+',
+                                                 dtype=self.dtype, shape=(self.segment_scans, len(self.channels)))
+        self.segment_first = self.total
+        self.position = 0
+
+    def _close_segment(self):
+        self.segment.flush()
+        self.index.write('%s %i %i\n'%(self.segment_name, self.segment_first, self.position))
+        self.index.flush()
+        self.segment = None
+        self.segment_number += 1
+
+    def write(self, block):
+        ''' Appends a scans x channels block. '''
+        block = np.asarray(block).reshape(-1, len(self.channels))
+        while len(block):
+            if self.segment is None:
+                self._open_segment()
+            n = min(len(block), self.segment_scans - self.position)
+            self.segment[self.position:self.position+n] = block[:n]
+            self.position += n
+            self.total += n
+            block = block[n:]
+            if self.position == self.segment_scans:
+                self._close_segment()
+
+    def close(self):
+        ''' Closes the current segment and the index. '''
+        if self.segment is not None:
+            self._close_segment()
+        self.index.close()
+
+class StreamReader:
+    ''' Lazily reads a recording written by StreamRecorder.
+
+        Args:
+            path (str): recording directory.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        self.channels = meta['channels']
+        self.scanRate = meta['scanRate']
+        self.start_time = np.datetime64(meta['start_time_ns'], 'ns')
+        self.segments = []
+        with open(os.path.join(path, 'index.txt')) as file:
+            for line in file:
+                name, first, n = line.split()
+                self.segments.append((name, int(first), int(n)))
+
+    @property
+    def scans(self):
+        ''' Number of scans in completed segments. '''
+        if not self.segments:
+            return 0
+        name, first, n = self.segments[-1]
+        return first + n
+
+    def _scan(self, t):
+        ''' Converts a datetime64 or a number of seconds since the start to a scan index. '''
+        if isinstance(t, (int, float)):
+            seconds = t
+        else:
+            seconds = (np.datetime64(t, 'ns') - self.start_time) / np.timedelta64(1, 's')
+        return int(np.clip(np.ceil(seconds * self.scanRate), 0, self.scans))
+
+    def read(self, start=0, stop=None):
+        ''' Returns timestamps and data for start <= t < stop, where both are
+            datetime64 values or seconds since the start of the recording.
+
+            Returns:
+                times (ndarray): datetime64[ns] timestamps.
+                data (ndarray): scans x channels array.
+        '''
+        first = self._scan(start)
+        last = self.scans if stop is None else self._scan(stop)
+        blocks = []
+        for name, seg_first, n in self.segments:
+            lo, hi = max(first, seg_first), min(last, seg_first+n)
+            if lo >= hi:
+                continue
+            segment = np.load(os.path.join(self.path, name), mmap_mode='r')
+            blocks.append(segment[lo-seg_first:hi-seg_first])
+        data = np.concatenate(blocks) if blocks else np.zeros((0, len(self.channels)))
+        offsets = (first + np.arange(len(data))) * (1e9 / self.scanRate)
+        return self.start_time + offsets.round().astype('timedelta64[ns]'), data
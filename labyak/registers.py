@@ -0,0 +1,28 @@
+''' Register batches resolved to Modbus addresses once and reused. '''
+
+class RegisterBatch:
+    ''' A fixed list of registers whose names are resolved to (address, type)
+        pairs on construction. Each read or write then goes straight through
+        the address-based LJM calls, so control loops only supply values.
+
+        Args:
+            labjack (LabJack): the device to communicate with.
+            registers (list): register names, e.g. ['DAC0', 'DAC1'].
+    '''
+    def __init__(self, labjack, registers):
+        self.labjack = labjack
+        self.registers = list(registers)
+        resolved = [labjack._resolve(register) for register in self.registers]
+        self.addresses = [address for address, dtype in resolved]
+        self.types = [dtype for address, dtype in resolved]
+
+    def __len__(self):
+        return len(self.registers)
+
+    def write(self, values):
+        ''' Writes one value per register, in order. '''
+        self.labjack._write_addresses(self.addresses, self.types, list(values))
+
+    def read(self):
+        ''' Reads all registers and returns their values in order. '''
+        return self.labjack._read_addresses(self.addresses, self.types)
@@ -0,0 +1,62 @@
+''' Fixed-size ring buffer of stream scans which hands out views instead of copies. '''
+import numpy as np
+
+class RingBuffer:
+    ''' Preallocated scans x channels ring buffer for one writer and many readers.
+
+        Every block is written twice, at its position and one capacity further,
+        so that any window of up to capacity scans is a contiguous slice and
+        can be returned as a view without copying. Views stay valid until
+        capacity further scans have been written; copy them to keep them longer.
+
+        Scans are addressed by cursor, the total number of scans written
+        before them, which increases monotonically across wraparounds.
+
+        Args:
+            capacity (int): number of scans retained.
+            channels (int): number of values per scan.
+    '''
+    def __init__(self, capacity, channels, dtype=float):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.data = np.full((2*self.capacity, channels), np.nan, dtype=dtype)
+        self.total = 0
+
+    def write(self, block):
+        ''' Copies a scans x channels block (or flat interleaved values) into the buffer. '''
+        block = np.asarray(block, dtype=self.data.dtype).reshape(-1, self.channels)
+        skipped = max(0, len(block) - self.capacity)
+        block = block[skipped:]
+        n = len(block)
+        start = (self.total + skipped) % self.capacity
+        first = min(n, self.capacity - start)
+        for offset in (0, self.capacity):
+            self.data[offset+start:offset+start+first] = block[:first]
+        if first < n:
+            self.data[:n-first] = block[first:]
+            self.data[self.capacity:self.capacity+n-first] = block[first:]
+        self.total += skipped + n    # publish only after the data is in place
+
+    def _view(self, first, n):
+        start = first % self.capacity
+        return self.data[start:start+n]
+
+    def latest(self, n):
+        ''' Returns a view of the most recent n scans (fewer if not yet available). '''
+        total = self.total
+        n = min(n, total, self.capacity)
+        return self._view(total-n, n)
+
+    def since(self, cursor):
+        ''' Returns a view of all scans written at or after cursor, together with
+            the cursor to pass next time and the cursor of the first returned
+            scan (later than the requested one if older scans were overwritten).
+
+            Returns:
+                data (ndarray): scans x channels view.
+                cursor (int): cursor following the last returned scan.
+                first (int): cursor of the first returned scan.
+        '''
+        total = self.total
+        first = max(cursor, total - self.capacity)
+        return self._view(first, total-first), total, first
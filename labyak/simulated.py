@@ -0,0 +1,892 @@
+''' In-process simulation of the LJM library and a LabJack T7/T4, allowing the
+    rest of labyak to be exercised and benchmarked without hardware. A
+    SimulatedLJM instance exposes the subset of the labjack.ljm function
+    interface used by labyak and can be passed to a LabJack as its backend:
+
+        from labyak import LabJack
+        from labyak.simulated import SimulatedLJM
+        sim = SimulatedLJM()
+        lj = LabJack(backend=sim)
+
+    The simulated device keeps a register file addressed like the real Modbus
+    map, STREAM_OUT buffers with loop support, and a clocked stream engine
+    which produces synthetic AIN data at the requested scan rate. Every call
+    is counted together with the number of Modbus packets (round trips) and
+    bytes it would have cost on the wire; see SimulatedLJM.stats().
+'''
+import threading
+import time
+import re
+import struct
+import numpy as np
+
+class constants:
+    ''' Mirror of the labjack.ljm.constants values used by labyak. '''
+    UINT16 = 0
+    UINT32 = 1
+    INT32 = 2
+    FLOAT32 = 3
+    BYTE = 99
+    STRING = 98
+
+    dtANY = 0
+    dtT4 = 4
+    dtT7 = 7
+
+    ctANY = 0
+    ctUSB = 1
+    ctTCP = 2
+    ctETHERNET = 3
+    ctWIFI = 4
+
+class errorcodes:
+    ''' Mirror of the labjack.ljm.errorcodes values raised by the simulator. '''
+    DEVICE_NOT_FOUND = 1227
+    INVALID_ADDRESS = 1250
+    INVALID_NAME = 1294
+    STREAM_NOT_RUNNING = 1303
+    CANNOT_READ_OUT_ONLY_STREAM = 1308
+    NO_SCANS_RETURNED = 1309
+    STREAM_IS_ACTIVE = 2605
+    STREAM_OUT_BUFFER_FULL = 2641
+
+class LJMError(Exception):
+    ''' Stand-in for labjack.ljm.LJMError with the same attributes. '''
+    def __init__(self, errorCode=None, errorAddress=None, errorString=None):
+        self.errorCode = errorCode
+        self.errorAddress = errorAddress
+        self.errorString = errorString or ''
+        super().__init__('LJM library error code %s %s'%(errorCode, self.errorString))
+
+DATA_TYPE_BYTES = {constants.UINT16: 2, constants.UINT32: 4, constants.INT32: 4,
+                   constants.FLOAT32: 4, constants.BYTE: 1}
+
+MAX_BYTES_PER_MB = {constants.ctUSB: 64, constants.ctETHERNET: 1040, constants.ctWIFI: 500}
+MAX_SCAN_RATE = {constants.dtT7: 100000, constants.dtT4: 40000}
+
+MB_HEADER_BYTES = 8     # MBAP header and function code of a Modbus feedback packet
+MB_FRAME_BYTES = 4      # frame type, address and register count
+
+F32, U16, U32, I32, BYTE = constants.FLOAT32, constants.UINT16, constants.UINT32, constants.INT32, constants.BYTE
+
+''' Indexed register families as (name pattern, indices, base address, stride, data type). '''
+INDEXED_REGISTERS = [
+    ('AIN%i', range(15), 0, 2, F32),
+    ('AIN%i_RANGE', range(15), 40000, 2, F32),
+    ('AIN%i_NEGATIVE_CH', range(15), 41000, 1, U16),
+    ('AIN%i_RESOLUTION_INDEX', range(15), 41500, 1, U16),
+    ('AIN%i_SETTLING_US', range(15), 42000, 2, F32),
+    ('AIN%i_EF_INDEX', range(15), 9000, 2, U32),
+    ('AIN%i_EF_OPTIONS', range(15), 9300, 2, U32),
+    ('AIN%i_EF_CONFIG_A', range(15), 9600, 2, U32),
+    ('AIN%i_EF_CONFIG_B', range(15), 9900, 2, U32),
+    ('AIN%i_EF_CONFIG_C', range(15), 10200, 2, U32),
+    ('AIN%i_EF_CONFIG_D', range(15), 10500, 2, F32),
+    ('AIN%i_EF_CONFIG_E', range(15), 10800, 2, F32),
+    ('AIN%i_EF_CONFIG_F', range(15), 11100, 2, F32),
+    ('AIN%i_EF_CONFIG_G', range(15), 11400, 2, F32),
+    ('AIN%i_EF_READ_A', range(15), 7000, 2, F32),
+    ('AIN%i_EF_READ_B', range(15), 7300, 2, F32),
+    ('AIN%i_EF_READ_C', range(15), 7600, 2, F32),
+    ('AIN%i_EF_READ_D', range(15), 7900, 2, F32),
+    ('DAC%i', range(2), 1000, 2, F32),
+    ('TDAC%i', range(23), 30000, 2, F32),
+    ('DIO%i', range(23), 2000, 1, U16),
+    ('FIO%i', range(8), 2000, 1, U16),
+    ('EIO%i', range(8), 2008, 1, U16),
+    ('CIO%i', range(4), 2016, 1, U16),
+    ('MIO%i', range(3), 2020, 1, U16),
+    ('DIO%i_EF_ENABLE', range(23), 44000, 2, U32),
+    ('DIO%i_EF_INDEX', range(23), 44100, 2, U32),
+    ('DIO%i_EF_OPTIONS', range(23), 44200, 2, U32),
+    ('DIO%i_EF_CONFIG_A', range(23), 44300, 2, U32),
+    ('DIO%i_EF_CONFIG_B', range(23), 44400, 2, U32),
+    ('DIO%i_EF_CONFIG_C', range(23), 44500, 2, U32),
+    ('DIO%i_EF_CONFIG_D', range(23), 44600, 2, U32),
+    ('DIO%i_EF_READ_A', range(23), 3000, 2, U32),
+    ('DIO%i_EF_READ_B', range(23), 3100, 2, U32),
+    ('DIO_EF_CLOCK%i_ENABLE', range(3), 44900, 10, U16),
+    ('DIO_EF_CLOCK%i_DIVISOR', range(3), 44901, 10, U16),
+    ('DIO_EF_CLOCK%i_OPTIONS', range(3), 44902, 10, U32),
+    ('DIO_EF_CLOCK%i_ROLL_VALUE', range(3), 44904, 10, U32),
+    ('DIO_EF_CLOCK%i_COUNT', range(3), 44908, 10, U32),
+    ('STREAM_OUT%i_TARGET', range(4), 4040, 2, U32),
+    ('STREAM_OUT%i_BUFFER_SIZE', range(4), 4050, 2, U32),
+    ('STREAM_OUT%i_LOOP_SIZE', range(4), 4060, 2, U32),
+    ('STREAM_OUT%i_SET_LOOP', range(4), 4070, 2, U32),
+    ('STREAM_OUT%i_BUFFER_STATUS', range(4), 4080, 2, U32),
+    ('STREAM_OUT%i_ENABLE', range(4), 4090, 2, U32),
+    ('STREAM_OUT%i_BUFFER_F32', range(4), 4400, 2, F32),
+    ('STREAM_OUT%i_BUFFER_U32', range(4), 4410, 2, U32),
+    ('STREAM_OUT%i_BUFFER_U16', range(4), 4420, 1, U16),
+    ('STREAM_OUT%i', range(4), 4800, 1, U16),
+]
+
+FIXED_REGISTERS = {
+    'FIO_STATE': (2500, U16), 'EIO_STATE': (2501, U16), 'CIO_STATE': (2502, U16), 'MIO_STATE': (2503, U16),
+    'FIO_EIO_STATE': (2580, U16), 'EIO_CIO_STATE': (2581, U16), 'CIO_MIO_STATE': (2582, U16),
+    'FIO_DIRECTION': (2600, U16), 'EIO_DIRECTION': (2601, U16), 'CIO_DIRECTION': (2602, U16), 'MIO_DIRECTION': (2603, U16),
+    'DIO_STATE': (2800, U32), 'DIO_DIRECTION': (2850, U32), 'DIO_ANALOG_ENABLE': (2880, U32), 'DIO_INHIBIT': (2900, U32),
+    'STREAM_SCANRATE_HZ': (4002, F32), 'STREAM_NUM_ADDRESSES': (4004, U32), 'STREAM_SAMPLES_PER_PACKET': (4006, U32),
+    'STREAM_SETTLING_US': (4008, F32), 'STREAM_RESOLUTION_INDEX': (4010, U32), 'STREAM_BUFFER_SIZE_BYTES': (4012, U32),
+    'STREAM_CLOCK_SOURCE': (4014, U32), 'STREAM_AUTO_TARGET': (4016, U32), 'STREAM_NUM_SCANS': (4020, U32),
+    'STREAM_EXTERNAL_CLOCK_DIVISOR': (4022, U32), 'STREAM_TRIGGER_INDEX': (4024, U32), 'STREAM_ENABLE': (4990, U32),
+    'SPI_CS_DIONUM': (5000, U16), 'SPI_CLK_DIONUM': (5001, U16), 'SPI_MISO_DIONUM': (5002, U16),
+    'SPI_MOSI_DIONUM': (5003, U16), 'SPI_MODE': (5004, U16), 'SPI_SPEED_THROTTLE': (5005, U16),
+    'SPI_OPTIONS': (5006, U16), 'SPI_GO': (5007, U16), 'SPI_NUM_BYTES': (5009, U16),
+    'SPI_DATA_TX': (5010, BYTE), 'SPI_DATA_RX': (5050, BYTE),
+    'I2C_SDA_DIONUM': (5100, U16), 'I2C_SCL_DIONUM': (5101, U16), 'I2C_SPEED_THROTTLE': (5102, U16),
+    'I2C_OPTIONS': (5103, U16), 'I2C_SLAVE_ADDRESS': (5104, U16), 'I2C_NUM_BYTES_TX': (5108, U16),
+    'I2C_NUM_BYTES_RX': (5109, U16), 'I2C_GO': (5110, U16), 'I2C_ACKS': (5114, U32),
+    'I2C_DATA_TX': (5120, BYTE), 'I2C_DATA_RX': (5160, BYTE),
+    'PRODUCT_ID': (60000, F32), 'FIRMWARE_VERSION': (60004, F32), 'SERIAL_NUMBER': (60028, U32),
+    'CORE_TIMER': (61520, U32), 'SYSTEM_TIMER_20HZ': (61522, U32), 'SYSTEM_REBOOT': (61998, U32),
+    'INTERNAL_FLASH_READ_POINTER': (61810, U32), 'INTERNAL_FLASH_READ': (61812, U32),
+}
+
+''' Flash address of the T7 calibration block and byte offset of the DAC constants within it. '''
+CALIBRATION_ADDRESS = 0x3C4000
+DAC_CALIBRATION_OFFSET = 128
+
+BUFFER_REGISTER = re.compile(r'^(STREAM_OUT\d+_BUFFER_(F32|U32|U16)|SPI_DATA_(TX|RX)|I2C_DATA_(TX|RX)|INTERNAL_FLASH_READ)$')
+
+def _build_register_map():
+    names = dict(FIXED_REGISTERS)
+    for pattern, indices, base, stride, dtype in INDEXED_REGISTERS:
+        for i in indices:
+            names[pattern%i] = (base + stride*i, dtype)
+    addresses = {}
+    for name, (address, dtype) in names.items():
+        addresses.setdefault(address, (name, dtype))
+    buffers = {names[name][0] for name in names if BUFFER_REGISTER.match(name)}
+    return names, addresses, buffers
+
+REGISTERS, ADDRESSES, BUFFERS = _build_register_map()
+
+class StreamOut:
+    ''' One STREAM_OUT slot: a FIFO of values which play once, followed by an
+        optional loop which repeats until replaced. '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.target = 0
+        self.buffer_size = 0
+        self.loop_size = 0
+        self.enabled = False
+        self.queue = np.zeros(0)
+        self.staged = np.zeros(0)
+        self.loop = None
+        self.loop_pos = 0
+        self.pending = None         # (queue, loop) waiting for the current loop to finish
+        self.binary = False         # last written through the U16 buffer: raw DAC codes
+        self.last = 0.0
+        self.underruns = 0
+
+    @property
+    def capacity(self):
+        return int(self.buffer_size) // 2
+
+    @property
+    def used(self):
+        n = len(self.queue) + len(self.staged)
+        if self.loop is not None:
+            n += len(self.loop)
+        if self.pending is not None:
+            n += len(self.pending[0]) + (len(self.pending[1]) if self.pending[1] is not None else 0)
+        return n
+
+    def write(self, values):
+        if self.used + len(values) > self.capacity:
+            raise LJMError(errorcodes.STREAM_OUT_BUFFER_FULL, errorString='STREAM_OUT buffer overflow')
+        if self.loop is None and self.pending is None:
+            self.queue = np.concatenate([self.queue, values])
+        else:
+            self.staged = np.concatenate([self.staged, values])
+
+    def set_loop(self, mode):
+        if mode == 1 and self.loop is not None and not len(self.staged):
+            self.loop_pos, self.pending = 0, None     ## replay the loop from its start
+            return
+        staged = np.concatenate([self.queue if self.loop is None else np.zeros(0), self.staged])
+        if self.loop is None:
+            self.queue = np.zeros(0)
+        self.staged = np.zeros(0)
+        n = int(self.loop_size)
+        if n > 0:
+            queue, loop = staged[:len(staged)-n], staged[len(staged)-n:]
+        else:
+            queue, loop = staged, None
+        if mode == 3 and self.loop is not None:
+            self.pending = (queue, loop)
+        else:
+            self.queue = queue
+            self.loop = loop
+            self.loop_pos = 0
+            self.pending = None
+
+    def consume(self, n):
+        ''' Advance by n samples and return the values which were output. '''
+        out = []
+        while n > 0:
+            if len(self.queue):
+                k = min(n, len(self.queue))
+                out.append(self.queue[:k])
+                self.queue = self.queue[k:]
+            elif self.loop is not None and len(self.loop):
+                L = len(self.loop)
+                k = min(n, L - self.loop_pos) if self.pending is not None else n
+                idx = (self.loop_pos + np.arange(k)) % L
+                out.append(self.loop[idx])
+                self.loop_pos = int((self.loop_pos + k) % L)
+                if self.pending is not None and self.loop_pos == 0:
+                    self.queue, self.loop = self.pending
+                    self.pending = None
+            else:
+                k = n
+                self.underruns += k
+                out.append(np.full(k, self.last))
+            self.last = out[-1][-1]
+            n -= k
+        return np.concatenate(out) if out else np.zeros(0)
+
+class SimulatedDevice:
+    ''' State of one simulated T-series device.
+
+        Args:
+            device_type (int): constants.dtT7 or constants.dtT4.
+            serial (int): serial number used as the open identifier.
+            connection_type (int): constants.ctUSB, ctETHERNET or ctWIFI; sets
+                                   the maximum packet size.
+            ip (str): IP address reported by getHandleInfo.
+    '''
+    def __init__(self, device_type=constants.dtT7, serial=470000000, connection_type=constants.ctETHERNET, ip='192.168.1.100'):
+        self.device_type = device_type
+        self.serial = serial
+        self.connection_type = connection_type
+        self.ip = ip
+        self.max_bytes = MAX_BYTES_PER_MB[connection_type]
+        self.lock = threading.RLock()
+
+        self.ain_source = lambda ch, t: np.sin(2*np.pi*(ch+1)*t)
+        self.spi_handler = lambda tx: list(tx)
+        self.i2c_slaves = {}
+        self.dac_calibration = [(13200.0, 0.0), (13200.0, 0.0)]     # (slope, offset) of DAC0 and DAC1
+        self.loopback = {}      # AIN channel -> name of the output wired to it, e.g. {0: 'DAC0'}
+        self.reset()
+
+    def reset(self):
+        ''' Restore power-on register values and stop any stream. '''
+        self.regs = {}
+        self.dio_state = 0
+        self.dio_direction = 0
+        self.spi_tx, self.spi_rx = [], []
+        self.i2c_tx, self.i2c_rx = [], []
+        self.stream_outs = [StreamOut() for i in range(4)]
+        self.running = False
+        self.scan_list = []
+        self.start_time = None
+        self.produced = 0
+        self.buffered = []
+        self.buffered_scans = 0
+        self.skipped = 0
+        self.callback = None
+        self.regs[REGISTERS['SERIAL_NUMBER'][0]] = self.serial
+        self.regs[REGISTERS['PRODUCT_ID'][0]] = self.device_type
+
+    ''' Register file '''
+    def read(self, address, now):
+        if address not in ADDRESSES:
+            raise LJMError(errorcodes.INVALID_ADDRESS, address)
+        name, dtype = ADDRESSES[address]
+        if 2000 <= address < 2023:
+            return float((self.dio_state >> (address-2000)) & 1)
+        if name == 'DIO_STATE':
+            return float(self.dio_state)
+        if name in ('FIO_STATE', 'EIO_STATE', 'CIO_STATE', 'MIO_STATE'):
+            shift, width = DIO_PORTS[name]
+            return float((self.dio_state >> shift) & ((1 << width)-1))
+        if name == 'DIO_DIRECTION':
+            return float(self.dio_direction)
+        if address < 30 and address % 2 == 0:
+            if address//2 in self.loopback:
+                return float(self.regs.get(REGISTERS[self.loopback[address//2]][0], 0))
+            return float(self.ain_source(address//2, now))
+        if 7000 <= address < 7030:
+            ch = (address-7000)//2
+            if self.regs.get(REGISTERS['AIN%i_EF_INDEX'%ch][0], 0) in (20, 21, 22, 23, 24, 25, 27, 28):
+                return 295.15 + 0.1*ch
+            return float(self.ain_source(ch, now))
+        if 4080 <= address < 4088:
+            slot = self.stream_outs[(address-4080)//2]
+            return float(slot.capacity - slot.used)
+        return float(self.regs.get(address, 0))
+
+    def write(self, address, value):
+        if address not in ADDRESSES:
+            raise LJMError(errorcodes.INVALID_ADDRESS, address)
+        name, dtype = ADDRESSES[address]
+        if dtype == U16:
+            value = int(value) & 0xFFFF
+        elif dtype == U32:
+            value = int(value) & 0xFFFFFFFF
+        elif dtype == I32:
+            value = int(value)
+        self.regs[address] = value
+
+        if 2000 <= address < 2023:
+            bit = 1 << (address-2000)
+            self.dio_direction |= bit
+            self.dio_state = (self.dio_state | bit) if value else (self.dio_state & ~bit)
+        elif name == 'DIO_STATE':
+            inhibit = self.regs.get(REGISTERS['DIO_INHIBIT'][0], 0)
+            self.dio_state = (self.dio_state & inhibit) | (value & ~inhibit & 0x7FFFFF)
+        elif name == 'DIO_DIRECTION':
+            inhibit = self.regs.get(REGISTERS['DIO_INHIBIT'][0], 0)
+            self.dio_direction = (self.dio_direction & inhibit) | (value & ~inhibit & 0x7FFFFF)
+        elif name in DIO_PORTS:
+            self._write_port(name, value)
+        elif 4040 <= address < 4100:
+            self._write_stream_out(name, value)
+        elif name == 'SPI_GO':
+            tx = self.spi_tx[:self.regs.get(REGISTERS['SPI_NUM_BYTES'][0], 0)]
+            self.spi_rx = [int(b) & 0xFF for b in self.spi_handler(tx)]
+        elif name == 'I2C_GO':
+            self._i2c_go()
+        elif name == 'SYSTEM_REBOOT':
+            self.reset()
+
+    def _write_port(self, name, value):
+        shift, width = DIO_PORTS[name]
+        mask = (1 << width) - 1
+        inhibit = (value >> 8) & mask
+        state = value & mask
+        old = (self.dio_state >> shift) & mask
+        new = (old & inhibit) | (state & ~inhibit & mask)
+        self.dio_state = (self.dio_state & ~(mask << shift)) | (new << shift)
+
+    def _write_stream_out(self, name, value):
+        i = int(name[len('STREAM_OUT')])
+        slot = self.stream_outs[i]
+        field = name[len('STREAM_OUT0_'):]
+        if field == 'TARGET':
+            slot.target = value
+        elif field == 'BUFFER_SIZE':
+            slot.buffer_size = value
+        elif field == 'LOOP_SIZE':
+            slot.loop_size = value
+        elif field == 'ENABLE':
+            if value and not slot.enabled:     ## enabling a disabled slot clears its buffer
+                slot.queue, slot.staged, slot.loop, slot.pending = np.zeros(0), np.zeros(0), None, None
+            slot.enabled = bool(value)
+        elif field == 'SET_LOOP':
+            slot.set_loop(value)
+
+    def _i2c_go(self):
+        addr = self.regs.get(REGISTERS['I2C_SLAVE_ADDRESS'][0], 0)
+        tx = self.i2c_tx[:self.regs.get(REGISTERS['I2C_NUM_BYTES_TX'][0], 0)]
+        nrx = self.regs.get(REGISTERS['I2C_NUM_BYTES_RX'][0], 0)
+        if addr not in self.i2c_slaves:
+            self.regs[REGISTERS['I2C_ACKS'][0]] = 0
+            self.i2c_rx = [0]*nrx
+            return
+        memory = self.i2c_slaves[addr]
+        reg = tx[0] if len(tx) else 0
+        for i, b in enumerate(tx[1:]):
+            memory[(reg+i) % len(memory)] = b
+        self.i2c_rx = [memory[(reg+i) % len(memory)] for i in range(nrx)]
+        self.regs[REGISTERS['I2C_ACKS'][0]] = ((1 << (1+len(tx))) - 1) & 0xFFFFFFFF    ## 32-bit register
+
+    def write_buffer(self, address, values):
+        name, dtype = ADDRESSES[address]
+        if name == 'SPI_DATA_TX':
+            self.spi_tx = [int(v) & 0xFF for v in values]
+        elif name == 'I2C_DATA_TX':
+            self.i2c_tx = [int(v) & 0xFF for v in values]
+        elif name.startswith('STREAM_OUT'):
+            values = np.asarray(values, dtype=float)
+            if dtype == U16:
+                values = np.floor(values) % 65536
+            slot = self.stream_outs[int(name[len('STREAM_OUT')])]
+            slot.write(values)
+            slot.binary = dtype == U16
+        else:
+            raise LJMError(errorcodes.INVALID_ADDRESS, address)
+
+    def read_buffer(self, address, n):
+        name, dtype = ADDRESSES[address]
+        if name == 'SPI_DATA_RX':
+            data = self.spi_rx
+        elif name == 'I2C_DATA_RX':
+            data = self.i2c_rx
+        elif name == 'INTERNAL_FLASH_READ':
+            pointer = REGISTERS['INTERNAL_FLASH_READ_POINTER'][0]
+            data = self.flash(self.regs.get(pointer, 0), n)
+            self.regs[pointer] = self.regs.get(pointer, 0) + n
+        else:
+            raise LJMError(errorcodes.INVALID_ADDRESS, address)
+        return [float(b) for b in (list(data) + [0]*n)[:n]]
+
+    def flash(self, address, n):
+        ''' Returns n bytes of flash from address: the calibration block of a
+            T7 holds the DAC constants, and the rest reads as erased. '''
+        block = bytearray(b'\xff'*DAC_CALIBRATION_OFFSET)
+        if self.device_type == constants.dtT7:
+            for slope, offset in self.dac_calibration:
+                block += struct.pack('>2f', slope, offset)
+        offset = address - CALIBRATION_ADDRESS
+        return [block[offset+i] if 0 <= offset+i < len(block) else 0xFF for i in range(n)]
+
+    ''' Stream engine '''
+    def start_stream(self, scans_per_read, scan_list, scan_rate, now):
+        if self.running:
+            raise LJMError(errorcodes.STREAM_IS_ACTIVE, errorString='Stream is already active')
+        scan_rate = min(float(scan_rate), MAX_SCAN_RATE[self.device_type] / len(scan_list))
+        self.scans_per_read = scans_per_read
+        self.scan_list = list(scan_list)
+        self.scan_rate = scan_rate
+        self.running = True
+        self.produced = 0
+        self.buffered = []
+        self.buffered_scans = 0
+        self.skipped = 0
+        self.num_scans = self.regs.get(REGISTERS['STREAM_NUM_SCANS'][0], 0)
+        self.start_time = None if self.regs.get(REGISTERS['STREAM_TRIGGER_INDEX'][0], 0) else now
+        return scan_rate
+
+    def trigger(self, now):
+        ''' Fire the stream trigger of an armed stream. '''
+        if self.running and self.start_time is None:
+            self.start_time = now
+
+    def stop_stream(self):
+        if not self.running:
+            raise LJMError(errorcodes.STREAM_NOT_RUNNING)
+        self.running = False
+        self.callback = None
+
+    @property
+    def reads_inputs(self):
+        return any(not 4800 <= a < 4804 for a in self.scan_list)
+
+    def backlog_limit(self):
+        ''' Number of scans the device can hold before auto-recovery kicks in. '''
+        size = self.regs.get(REGISTERS['STREAM_BUFFER_SIZE_BYTES'][0], 0) or 32768
+        return max(1, size // (2*len(self.scan_list)))
+
+    def advance(self, now):
+        ''' Produce all scans up to the given time. '''
+        if not self.running or self.start_time is None:
+            return
+        ## round away float error so that advancing to start_time + k/scan_rate
+        ## produces exactly k scans
+        target = int(np.floor((now - self.start_time) * self.scan_rate + 1e-6))
+        if self.num_scans:
+            target = min(target, self.num_scans)
+        n = target - self.produced
+        if n <= 0:
+            return
+        block = self._scans(self.produced, n)
+        self.produced = target
+        if not self.reads_inputs:
+            return
+        room = max(0, self.backlog_limit() - self.buffered_scans)
+        if n > room:
+            self.skipped += n - room
+            block[room:] = -9999.0
+        self.buffered.append(block)
+        self.buffered_scans += n
+
+    def _scans(self, first, n):
+        ''' Generate n scans starting at scan index first. '''
+        t = (first + np.arange(n)) / self.scan_rate
+        block = np.empty((n, len(self.scan_list)))
+        outputs, driven = {}, {}
+        for i, slot in enumerate(self.stream_outs):
+            if 4800+i in self.scan_list:
+                outputs[4800+i] = slot.consume(n)
+                name = ADDRESSES.get(slot.target, ('',))[0]
+                if slot.binary and name in ('DAC0', 'DAC1'):
+                    slope, offset = self.dac_calibration[int(name[-1])]
+                    outputs[4800+i] = ((outputs[4800+i].astype(int) & 0xFFF0) - offset) / slope    ## 12-bit DAC
+                driven[name] = outputs[4800+i]
+                for value in outputs[4800+i][-1:]:
+                    if name in DIO_PORTS:
+                        self._write_port(name, int(value))
+                    else:
+                        self.regs[slot.target] = value
+        for j, address in enumerate(self.scan_list):
+            if address in outputs:
+                block[:, j] = outputs[address]
+            elif address < 30 and address % 2 == 0 and self.loopback.get(address//2) in driven:
+                block[:, j] = driven[self.loopback[address//2]]
+            elif address < 30 and address % 2 == 0:
+                block[:, j] = self.ain_source(address//2, t)
+            elif ADDRESSES.get(address, ('',))[0] in driven and ADDRESSES[address][0] in DIO_PORTS:
+                shift, width = DIO_PORTS[ADDRESSES[address][0]]
+                mask = (1 << width) - 1
+                words = driven[ADDRESSES[address][0]].astype(int)
+                inhibit = (words >> 8) & mask
+                block[:, j] = (((self.dio_state >> shift) & mask) & inhibit) | (words & ~inhibit & mask)
+            else:
+                block[:, j] = self.read(address, 0)
+        return block
+
+    def available(self):
+        return self.buffered_scans
+
+    def pop(self, n):
+        ''' Remove n scans from the LJM-side buffer. '''
+        data = np.concatenate(self.buffered) if len(self.buffered) > 1 else self.buffered[0]
+        out, rest = data[:n], data[n:]
+        self.buffered = [rest] if len(rest) else []
+        self.buffered_scans -= n
+        return out
+
+''' Bit offset and width of each digital port within DIO_STATE. '''
+DIO_PORTS = {'FIO_STATE': (0, 8), 'EIO_STATE': (8, 8), 'CIO_STATE': (16, 4), 'MIO_STATE': (20, 3)}
+
+class SimulatedLJM:
+    ''' Drop-in replacement for the labjack.ljm module backed by simulated devices.
+
+        Args:
+            devices (list): SimulatedDevice instances available to openS. By
+                            default a single T7 on Ethernet is created.
+            realtime (bool): if True, streams are clocked by the wall clock and
+                             eStreamRead blocks until data is ready. If False,
+                             a virtual clock is used which eStreamRead jumps
+                             forward as needed, so benchmarks measure host CPU
+                             time only; call advance() to let time pass.
+            latency (float): simulated duration in seconds of each Modbus
+                             round trip, e.g. 1e-3 to mimic Ethernet.
+    '''
+    constants = constants
+    errorcodes = errorcodes
+    LJMError = LJMError
+
+    def __init__(self, devices=None, realtime=True, latency=0):
+        self.devices = devices if devices is not None else [SimulatedDevice()]
+        self.realtime = realtime
+        self.latency = latency
+        self.config = {}
+        self.handles = {}
+        self._next_handle = 1
+        self._virtual_time = 0.0
+        self._counters = {}
+        self._stats_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+
+    ''' Clock and statistics '''
+    def now(self):
+        if self.realtime:
+            return time.monotonic()
+        return self._virtual_time
+
+    def advance(self, seconds):
+        ''' Let the given amount of time pass on the virtual clock. '''
+        self._virtual_time += seconds
+        for device in set(self.handles.values()):
+            with device.lock:
+                device.advance(self.now())
+            self._notify(device)
+
+    def trigger(self, handles=None):
+        ''' Fire the hardware trigger on the given handles (default all), starting
+            any armed streams at the same instant. '''
+        now = self.now()
+        for handle in (handles if handles is not None else list(self.handles)):
+            device = self.handles[handle]
+            with device.lock:
+                device.trigger(now)
+
+    def _record(self, handle, op, frames=(), stream_bytes=0):
+        ''' Account for one call. frames is a list of (write, nbytes) Modbus frames. '''
+        device = self.handles.get(handle)
+        limit = device.max_bytes if device is not None else 1040
+        packets, out_bytes, in_bytes = 0, 0, 0
+        req = resp = None
+        for write, nbytes in frames:
+            while True:
+                chunk = min(nbytes, limit - MB_HEADER_BYTES - MB_FRAME_BYTES)
+                r = MB_FRAME_BYTES + (chunk if write else 0)
+                s = 1 + (0 if write else chunk)
+                if req is None or req + r > limit or resp + s > limit:
+                    packets += 1
+                    out_bytes += MB_HEADER_BYTES
+                    in_bytes += MB_HEADER_BYTES
+                    req = resp = MB_HEADER_BYTES
+                req += r
+                resp += s
+                out_bytes += r
+                in_bytes += s
+                nbytes -= chunk
+                if nbytes <= 0:
+                    break
+        in_bytes += stream_bytes
+        with self._stats_lock:
+            c = self._counters.setdefault((handle, op), {'calls': 0, 'packets': 0, 'bytes_out': 0, 'bytes_in': 0, 'frames': 0})
+            c['calls'] += 1
+            c['packets'] += packets
+            c['bytes_out'] += out_bytes
+            c['bytes_in'] += in_bytes
+            c['frames'] += len(frames)
+        if self.latency and packets:
+            time.sleep(self.latency * packets)
+
+    def stats(self, handle=None):
+        ''' Returns a dict mapping each LJM function name to its call count,
+            Modbus packets (round trips), bytes sent and received, and frames.
+            If handle is given only calls on that handle are included; the
+            'total' entry sums all functions. '''
+        result = {}
+        total = {'calls': 0, 'packets': 0, 'bytes_out': 0, 'bytes_in': 0, 'frames': 0}
+        with self._stats_lock:
+            for (h, op), c in self._counters.items():
+                if handle is not None and h != handle:
+                    continue
+                entry = result.setdefault(op, dict.fromkeys(total, 0))
+                for key in total:
+                    entry[key] += c[key]
+                    total[key] += c[key]
+        result['total'] = total
+        return result
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._counters = {}
+
+    ''' Name resolution '''
+    def nameToAddress(self, name):
+        try:
+            return REGISTERS[name]
+        except KeyError:
+            raise LJMError(errorcodes.INVALID_NAME, errorString='Invalid name: %s'%name)
+
+    def namesToAddresses(self, numFrames, aNames, aAddresses=None, aDataTypes=None):
+        pairs = [self.nameToAddress(name) for name in aNames[:numFrames]]
+        return [p[0] for p in pairs], [p[1] for p in pairs]
+
+    def addressToType(self, address):
+        return ADDRESSES[address][1]
+
+    def _device(self, handle):
+        try:
+            return self.handles[handle]
+        except KeyError:
+            raise LJMError(1224, errorString='Invalid handle')
+
+    ''' Device connection '''
+    def openS(self, deviceType='ANY', connectionType='ANY', identifier='ANY'):
+        types = {'ANY': None, 'T7': constants.dtT7, 'T4': constants.dtT4}
+        connections = {'ANY': None, 'USB': constants.ctUSB, 'ETHERNET': constants.ctETHERNET,
+                       'TCP': constants.ctETHERNET, 'WIFI': constants.ctWIFI}
+        dt = types.get(str(deviceType).upper(), deviceType)
+        ct = connections.get(str(connectionType).upper(), connectionType)
+        for device in self.devices:
+            if dt not in (None, constants.dtANY) and device.device_type != dt:
+                continue
+            if ct not in (None, constants.ctANY) and device.connection_type != ct:
+                continue
+            if str(identifier).upper() not in ('ANY', str(device.serial), device.ip):
+                continue
+            with self._open_lock:
+                handle = self._next_handle
+                self._next_handle += 1
+                self.handles[handle] = device
+            self._record(handle, 'openS', [(False, 4)])
+            return handle
+        raise LJMError(errorcodes.DEVICE_NOT_FOUND, errorString='Device not found (%s)'%identifier)
+
+    def getHandleInfo(self, handle):
+        d = self._device(handle)
+        return d.device_type, d.connection_type, d.serial, 0, 502, d.max_bytes
+
+    def close(self, handle):
+        device = self.handles.pop(handle, None)
+        if device is not None and device.running:
+            device.stop_stream()
+
+    def closeAll(self):
+        for handle in list(self.handles):
+            self.close(handle)
+
+    def setDeviceReconnectCallback(self, handle, callback):
+        self._device(handle).reconnect_callback = callback
+
+    def power_cycle(self, handle):
+        ''' Resets the device to power-on state and fires the reconnect callback,
+            as LJM does when it re-establishes a dropped connection. '''
+        device = self._device(handle)
+        with device.lock:
+            device.reset()
+        callback = getattr(device, 'reconnect_callback', None)
+        if callback:
+            callback(handle)
+
+    def writeLibraryConfigS(self, parameter, value):
+        self.config[parameter] = value
+
+    def readLibraryConfigS(self, parameter):
+        return self.config.get(parameter, 0)
+
+    ''' Command-response '''
+    def eAddresses(self, handle, numFrames, aAddresses, aDataTypes, aWrites, aNumValues, aValues):
+        return self._call('eAddresses', handle, aAddresses[:numFrames], aDataTypes[:numFrames],
+                          aWrites[:numFrames], aNumValues[:numFrames], aValues)
+
+    def _call(self, op, handle, aAddresses, aDataTypes, aWrites, aNumValues, aValues):
+        ''' Executes a list of read/write frames as one transaction and accounts
+            for it under the name of the LJM function op. '''
+        numFrames = len(aAddresses)
+        device = self._device(handle)
+        frames, results, k = [], [], 0
+        with device.lock:
+            now = self.now()
+            device.advance(now)
+            for i in range(numFrames):
+                address, dtype, write, n = aAddresses[i], aDataTypes[i], aWrites[i], aNumValues[i]
+                values = aValues[k:k+n]
+                k += n
+                if address in BUFFERS:
+                    if write:
+                        device.write_buffer(address, values)
+                        results.extend(values)
+                    else:
+                        results.extend(device.read_buffer(address, n))
+                else:
+                    width = DATA_TYPE_BYTES[ADDRESSES[address][1]] if address in ADDRESSES else 4
+                    for j in range(n):
+                        a = address + j*(width//2)
+                        if write:
+                            device.write(a, values[j])
+                            results.append(values[j])
+                        else:
+                            results.append(device.read(a, now))
+                frames.append((bool(write), n*DATA_TYPE_BYTES[dtype]))
+        self._record(handle, op, frames)
+        return results
+
+    def eNames(self, handle, numFrames, aNames, aWrites, aNumValues, aValues):
+        addresses, types = self.namesToAddresses(numFrames, aNames)
+        return self._call('eNames', handle, addresses, types, aWrites[:numFrames], aNumValues[:numFrames], aValues)
+
+    def eReadAddress(self, handle, address, dataType):
+        return self._call('eReadAddress', handle, [address], [dataType], [0], [1], [0])[0]
+
+    def eReadAddresses(self, handle, numFrames, aAddresses, aDataTypes):
+        return self._call('eReadAddresses', handle, aAddresses[:numFrames], aDataTypes[:numFrames],
+                          [0]*numFrames, [1]*numFrames, [0]*numFrames)
+
+    def eReadName(self, handle, name):
+        address, dtype = self.nameToAddress(name)
+        return self._call('eReadName', handle, [address], [dtype], [0], [1], [0])[0]
+
+    def eReadNames(self, handle, numFrames, aNames):
+        addresses, types = self.namesToAddresses(numFrames, aNames)
+        return self._call('eReadNames', handle, addresses, types, [0]*numFrames, [1]*numFrames, [0]*numFrames)
+
+    def eWriteAddress(self, handle, address, dataType, value):
+        self._call('eWriteAddress', handle, [address], [dataType], [1], [1], [value])
+
+    def eWriteAddresses(self, handle, numFrames, aAddresses, aDataTypes, aValues):
+        self._call('eWriteAddresses', handle, aAddresses[:numFrames], aDataTypes[:numFrames],
+                   [1]*numFrames, [1]*numFrames, aValues[:numFrames])
+
+    def eWriteName(self, handle, name, value):
+        address, dtype = self.nameToAddress(name)
+        self._call('eWriteName', handle, [address], [dtype], [1], [1], [value])
+
+    def eWriteNames(self, handle, numFrames, aNames, aValues):
+        addresses, types = self.namesToAddresses(numFrames, aNames)
+        self._call('eWriteNames', handle, addresses, types, [1]*numFrames, [1]*numFrames, aValues[:numFrames])
+
+    def eReadAddressArray(self, handle, address, dataType, numValues):
+        return self._call('eReadAddressArray', handle, [address], [dataType], [0], [numValues], [0]*numValues)
+
+    def eReadNameArray(self, handle, name, numValues):
+        address, dtype = self.nameToAddress(name)
+        return self._call('eReadNameArray', handle, [address], [dtype], [0], [numValues], [0]*numValues)
+
+    def eWriteAddressArray(self, handle, address, dataType, numValues, aValues):
+        self._call('eWriteAddressArray', handle, [address], [dataType], [1], [numValues], aValues[:numValues])
+
+    def eWriteNameArray(self, handle, name, numValues, aValues):
+        address, dtype = self.nameToAddress(name)
+        self._call('eWriteNameArray', handle, [address], [dtype], [1], [numValues], aValues[:numValues])
+
+    def eReadNameByteArray(self, handle, name, numBytes):
+        address, dtype = self.nameToAddress(name)
+        return [int(b) for b in self._call('eReadNameByteArray', handle, [address], [BYTE], [0], [numBytes], [0]*numBytes)]
+
+    def eWriteNameByteArray(self, handle, name, numBytes, aBytes):
+        address, dtype = self.nameToAddress(name)
+        self._call('eWriteNameByteArray', handle, [address], [BYTE], [1], [numBytes], list(aBytes)[:numBytes])
+
+    ''' Streaming '''
+    def eStreamStart(self, handle, scansPerRead, numAddresses, aScanList, scanRate):
+        device = self._device(handle)
+        with device.lock:
+            scan_rate = device.start_stream(scansPerRead, aScanList[:numAddresses], scanRate, self.now())
+        self._record(handle, 'eStreamStart', [(True, 4*(6+numAddresses))])
+        return scan_rate
+
+    def eStreamRead(self, handle):
+        device = self._device(handle)
+        while True:
+            with device.lock:
+                if not device.running:
+                    raise LJMError(errorcodes.STREAM_NOT_RUNNING)
+                if not device.reads_inputs:
+                    raise LJMError(errorcodes.CANNOT_READ_OUT_ONLY_STREAM)
+                device.advance(self.now())
+                n = device.scans_per_read
+                if device.available() >= n:
+                    data = device.pop(n)
+                    backlog = device.available()
+                    break
+                if not self.realtime:
+                    if device.start_time is None:
+                        raise LJMError(errorcodes.NO_SCANS_RETURNED, errorString='Stream is waiting for a trigger')
+                    needed = device.produced + n - device.available()
+                    self._virtual_time = max(self._virtual_time, device.start_time + needed / device.scan_rate)
+                    continue
+                wait = (n - device.available()) / device.scan_rate if device.start_time is not None else 1e-3
+            time.sleep(min(wait, 0.05))
+        self._record(handle, 'eStreamRead', stream_bytes=2*data.size)
+        return data.ravel().tolist(), 0, backlog
+
+    def eStreamStop(self, handle):
+        device = self._device(handle)
+        with device.lock:
+            device.advance(self.now())
+            device.stop_stream()
+        self._record(handle, 'eStreamStop', [(True, 4)])
+
+    def setStreamCallback(self, handle, callback):
+        ''' Calls callback(handle) from a background thread whenever
+            scansPerRead scans are ready, as LJM's stream thread does. '''
+        device = self._device(handle)
+        device.callback = callback
+        if callback is None or callback == 0 or not self.realtime:
+            return
+
+        def run():
+            while device.running and device.callback is callback:
+                with device.lock:
+                    device.advance(self.now())
+                    ready = device.available() >= device.scans_per_read
+                    wait = 0 if ready else (device.scans_per_read - device.available()) / device.scan_rate
+                if ready:
+                    callback(handle)
+                else:
+                    time.sleep(min(wait, 0.05) if device.start_time is not None else 1e-3)
+        threading.Thread(target=run, daemon=True).start()
+
+    def _notify(self, device):
+        ''' Deliver pending callbacks on the virtual clock. '''
+        callback = device.callback
+        if callback is None or callback == 0 or self.realtime:
+            return
+        handle = next(h for h, d in self.handles.items() if d is device)
+        while device.running and device.callback is callback and device.available() >= device.scans_per_read:
+            callback(handle)
@@ -1,7 +1,10 @@
 ''' Digital communications module featuring SPI capabilities. '''
-from labjack import ljm
+import numpy as np
 
 class SPI:
+    ''' Largest number of bytes in one SPI transaction (SPI_DATA_TX/RX). '''
+    MAX_BYTES = 56
+
     def __init__(self, labjack):
         self.labjack = labjack
 
@@ -25,12 +28,9 @@ class SPI:
         })
 
     def write_string(self, cmd):
-        ''' Separates the bitstring cmd into a series of bytes and sends them through the SPI. '''
-        lst = []
-        r = 0
-        for i in [0, 8, 16]:
-            lst.append(int(cmd[i:8+i],2))
-        r = self.write_bytes(lst)
+        ''' Separates the bitstring cmd, whose length is a multiple of 8, into
+            a series of bytes and sends them through the SPI. '''
+        self.write_bytes([int(cmd[i:8+i], 2) for i in range(0, len(cmd), 8)])
 
     def write_bytes(self, data):
         ''' Writes a list of commands via SPI.
@@ -38,9 +38,58 @@ class SPI:
             Args:
                 data (list): a list of bytes to send through MOSI.
         '''
-        numBytes = len(data)
-        self.labjack._command("SPI_NUM_BYTES", numBytes)
+        self.transfer(data, read=False)
+
+    def _chunk(self):
+        ''' Bytes per transaction: the SPI buffer, or less if the NUM_BYTES,
+            DATA_TX, GO and DATA_RX frames would not fit in one packet. '''
+        return min(self.MAX_BYTES, self.labjack.max_bytes - 8 - 4*4 - 2*2)
+
+    def _frames(self, tx, read):
+        ''' Returns the frames of one transaction per chunk of tx. '''
+        constants = self.labjack.ljm.constants
+        num_bytes = self.labjack._resolve('SPI_NUM_BYTES')[0]
+        data_tx = self.labjack._resolve('SPI_DATA_TX')[0]
+        go = self.labjack._resolve('SPI_GO')[0]
+        data_rx = self.labjack._resolve('SPI_DATA_RX')[0]
+        chunk = self._chunk()
+        frames = []
+        for i in range(0, len(tx), chunk):
+            block = tx[i:i+chunk]
+            frames += [(num_bytes, constants.UINT16, True, [len(block)]),
+                       (data_tx, constants.BYTE, True, block),
+                       (go, constants.UINT16, True, [1])]
+            if read:
+                frames.append((data_rx, constants.BYTE, False, len(block)))
+        return frames
+
+    def transfer(self, tx, read=True, as_array=False):
+        ''' Clocks tx out on MOSI while reading MISO. Payloads longer than
+            MAX_BYTES are sent as consecutive transactions, with chip select
+            released in between. Setup, data, GO and readback share packets.
+
+            Args:
+                tx (bytes): bytes to send, as bytes, a list or a NumPy array.
+                read (bool): if False, skip reading SPI_DATA_RX.
+                as_array (bool): return the received bytes as a uint8 array.
+
+            Returns:
+                rx: the received bytes (as bytes unless as_array), or None if
+                    read is False.
+        '''
+        return self.transfer_many([tx], read=read, as_array=as_array)[0]
 
-        # Write the bytes
-        ljm.eWriteNameByteArray(self.labjack.handle, "SPI_DATA_TX", len(data), data)
-        self.labjack._command("SPI_GO", 1)  # Do the SPI communications
+    def transfer_many(self, txs, read=True, as_array=False):
+        ''' Runs several transfers in order, packing their frames into as few
+            packets as possible, and returns a list with the result of each
+            (see transfer()). '''
+        txs = [np.frombuffer(tx, dtype=np.uint8).tolist() if isinstance(tx, (bytes, bytearray))
+               else np.asarray(tx, dtype=np.uint8).ravel().tolist() for tx in txs]
+        reads = iter(self.labjack._exchange([f for tx in txs for f in self._frames(tx, read)]))
+        if not read:
+            return [None]*len(txs)
+        results = []
+        for tx in txs:
+            rx = bytes(int(b) for i in range(0, len(tx), self._chunk()) for b in next(reads))
+            results.append(np.frombuffer(rx, dtype=np.uint8) if as_array else rx)
+        return results
@@ -1,103 +1,341 @@
-from labjack import ljm
-from scipy.signal import resample
+import time
 import numpy as np
+from labyak.digital import Digital
+from labyak.stream_feeder import StreamFeeder
+from labyak.stream_session import StreamSession
 
 class Stream:
+    ''' Stream clock frequency in Hz. Achievable scan rates are this frequency
+        divided by an integer number of ticks per scan. '''
+    CLOCK = 80e6
+    ''' Longest loop which leaves room for an update() in the largest buffer. '''
+    MAX_UPDATABLE = 4095
+
     def __init__(self, labjack):
         self.labjack = labjack
+        self.batches = {}
+        self.trigger = None     ## DIO channel which starts streams, see arm()
+        self.buffer_sizes = {}  ## STREAM_OUT slot -> buffer size in bytes, set by _load()
+        self.loop_sizes = {}    ## STREAM_OUT slot -> samples in its loop, set by _load() and update()
 
     def configure(self, settling_time=0, resolution_index=0, clock_source=0):
         self.stop()
-        self.labjack._write_dict({'STREAM_SETTLING_US': settling_time,
-                                  'STREAM_RESOLUTION_INDEX': resolution_index,
-                                  'STREAM_CLOCK_SOURCE': clock_source
-                        })
+        batch = self.batches.get('configure')
+        if batch is None:
+            batch = self.batches['configure'] = self.labjack.compile(['STREAM_SETTLING_US',
+                                                                      'STREAM_RESOLUTION_INDEX',
+                                                                      'STREAM_CLOCK_SOURCE'])
+        batch.write([settling_time, resolution_index, clock_source])
 
     def set_inhibit(self, channels):
         bitmask = self.labjack.digital.bitmask(channels)
         inhibit = 0x7FFFFF-bitmask
 
-        self.labjack._write_dict({'DIO_INHIBIT': inhibit,
-                                  'DIO_DIRECTION': bitmask
-                                  })
+        batch = self.batches.get('inhibit')
+        if batch is None:
+            batch = self.batches['inhibit'] = self.labjack.compile(['DIO_INHIBIT', 'DIO_DIRECTION'])
+        batch.write([inhibit, bitmask])
 
     def stop(self):
         ''' Stop streaming if currently running '''
+        self.labjack.barrier()
         try:
-            ljm.eStreamStop(self.labjack.handle)
+            self.labjack.ljm.eStreamStop(self.labjack.handle)
         except:
             pass
 
-    def resample(self, array, period, max_samples = 8191):
-        ''' Compute optimum scan rate and number of samples '''
-        if self.labjack.deviceType == ljm.constants.dtT7:
-            max_speed = 100000
-        elif self.labjack.deviceType == ljm.constants.dtT4:
-            max_speed = 40000
+    def max_speed(self):
+        ''' Returns the maximum total stream rate of the device in samples/second. '''
+        if self.labjack.deviceType == self.labjack.ljm.constants.dtT4:
+            return 40000
+        return 100000
+
+    @staticmethod
+    def divisors(n, lo, hi):
+        ''' Returns the divisors of the integer n between lo and hi, ascending. '''
+        n = int(n)
+        if n < 1:
+            return np.zeros(0, dtype=np.int64)
+        i = np.arange(1, int(np.sqrt(n)) + 1, dtype=np.int64)
+        i = i[n % i == 0]
+        divisors = np.unique(np.concatenate([i, n // i]))
+        return divisors[(divisors >= lo) & (divisors <= hi)]
+
+    @staticmethod
+    def nearest_divisor(ticks, period_ticks, lo, max_samples, candidates=4096, block=2**20):
+        ''' Returns the number of clock ticks per sample, from lo upward, which
+            minimizes the worst-case rounding error of the passed tick counts and
+            of the period. Candidates are scored in chunks of about block
+            elements so that memory stays bounded for long sequences. '''
+        d = np.arange(lo, lo + min(lo, candidates), dtype=np.int64)
+        if max_samples is not None:
+            d = d[np.round(period_ticks / d) <= max_samples]
+        points = np.append(ticks, period_ticks)[:, None]
+        step = max(1, block // len(points))
+        best, best_error = None, np.inf
+        for i in range(0, len(d), step):
+            chunk = d[i:i+step]
+            error = np.abs(np.round(points / chunk) * chunk - points).max(axis=0)
+            j = np.argmin(error)
+            if error[j] < best_error:
+                best, best_error = int(chunk[j]), error[j]
+        return best
+
+    def resample(self, array, period, max_samples = 8191, method='fft', exact=False):
+        ''' Converts one period of a waveform to a looped stream. Compute optimum
+            scan rate and number of samples: long periods use max_samples at a
+            reduced rate, short ones the maximum rate shared between channels.
+            If max_samples is None, the maximum scan rate is always used, for
+            continuous streaming with Stream.feed.
+
+            Args:
+                array: samples x channels array (or 1-D for one channel) holding
+                       one period, or a callable V(t) returning such an array for
+                       an array of times in [0, period).
+                period (float): duration of one period in seconds.
+                max_samples (int): maximum number of output samples.
+                method (str): 'fft' (scipy.signal.resample), 'poly'
+                              (scipy.signal.resample_poly), or 'linear'
+                              interpolation. Ignored for callables.
+                exact (bool): if True, choose the scan rate so that the samples
+                              last exactly one period on the stream clock, so
+                              the loop closes without a phase jump.
 
-        cutoff = max_samples / max_speed
-        if period >= cutoff:
+            Returns:
+                stream (array): the resampled waveform.
+                scanRate (float): Stream rate in samples/second on each channel.
+        '''
+        if callable(array):
+            channels = np.asarray(array(np.zeros(1))).reshape(1, -1).shape[1]
+        else:
+            array = np.asarray(array, dtype=float)
+            channels = 1 if array.ndim == 1 else array.shape[1]
+        max_speed = self.max_speed() / channels    ## one stream-out per channel
+
+        if exact:
+            period_ticks = int(round(period * self.CLOCK))
+            lo = int(np.ceil(self.CLOCK / max_speed))
+            if max_samples is not None:
+                lo = max(lo, int(np.ceil(period_ticks / max_samples)))
+            divisors = self.divisors(period_ticks, lo, self.CLOCK)
+            divisor = int(divisors[0]) if len(divisors) else self.nearest_divisor([], period_ticks, lo, max_samples)
+            samples = max(1, int(round(period_ticks / divisor)))
+            scanRate = self.CLOCK / divisor
+        elif max_samples is None:
+            scanRate = max_speed
+            samples = int(period*scanRate)
+        elif period >= max_samples / max_speed:
             samples = max_samples
             scanRate = int(samples/period)
         else:
             scanRate = max_speed
             samples = int(period*scanRate)
 
-        stream = resample(array, samples)
-        scanRate /= array.shape[1]    ## divide by number of channels being streamed
-        return stream, scanRate
+        return self.resample_to(array, period, samples, method=method), scanRate
+
+    @staticmethod
+    def resample_to(array, period, samples, method='fft'):
+        ''' Resamples one period of a waveform to a given number of samples.
+            Arguments are as for resample(). '''
+        if callable(array):
+            return np.asarray(array(np.arange(samples) * (period / samples)), dtype=float)
+        array = np.asarray(array, dtype=float)
+        if method == 'fft':
+            from scipy.signal import resample
+            return resample(array, samples, axis=0)
+        elif method == 'poly':
+            from math import gcd
+            from scipy.signal import resample_poly
+            g = gcd(samples, len(array))
+            return resample_poly(array, samples // g, len(array) // g, axis=0, padtype='wrap')
+        elif method == 'linear':
+            x = np.arange(len(array) + 1) / len(array)
+            periodic = np.concatenate([array, array[:1]])
+            xi = np.arange(samples) / samples
+            if periodic.ndim == 1:
+                return np.interp(xi, x, periodic)
+            return np.column_stack([np.interp(xi, x, periodic[:, j]) for j in range(periodic.shape[1])])
+        raise ValueError("method must be 'fft', 'poly' or 'linear'")
 
     def AIn_start(self, channels, scan_rate):
         self.stop()
-        scan_list = ljm.namesToAddresses(len(channels), channels)[0]
+        scan_list = self.labjack.ljm.namesToAddresses(len(channels), channels)[0]
 
         scans_per_read = int(scan_rate/2)
-        ljm.eStreamStart(self.labjack.handle, scans_per_read, len(channels), scan_list, scan_rate)
+        self.labjack.barrier()
+        return self.labjack.ljm.eStreamStart(self.labjack.handle, scans_per_read, len(channels), scan_list, scan_rate)
 
     def AIn_read(self):
-        return ljm.eStreamRead(self.labjack.handle)
+        return self.labjack.ljm.eStreamRead(self.labjack.handle)
 
-    def AOut(self, channels, data, scanRate, loop=0):
-        self._start([1000+2*ch for ch in channels], data, scanRate, loop=loop, dtype='F32')
+    def AOut(self, channels, data, scanRate, loop=0, key=None, dtype='F32'):
+        ''' Streams voltages to DAC channels, or DAC codes from
+            Analog.quantize() if dtype is 'U16'. '''
+        return self._start([1000+2*ch for ch in channels], data, scanRate, loop=loop, dtype=dtype, key=key)
 
-    def DOut(self, data, scanRate, loop=0):
-        self._start([2500], data, scanRate, loop=loop, dtype='U16')
+    def DOut(self, data, scanRate, loop=0, ports=['FIO_STATE'], key=None):
+        ''' Streams U16 port words, with one column of data per port register
+            as returned by Digital.array_to_bitmask. '''
+        return self._start([Digital.PORTS[port][0] for port in ports], data, scanRate, loop=loop, dtype='U16', key=key)
 
-    def _start(self, channels, data, scanRate, loop = 0, dtype='F32'):
+    def feed(self, targets, source, scanRate, dtype='F32', loop=False, **kwargs):
+        ''' Starts continuous stream-out from an array or iterator of chunks,
+            refilling the device buffers from a background thread. Unlike
+            AOut/DOut the data is not limited to the STREAM_OUT buffer size.
+
+            Args:
+                targets (list): Modbus addresses to output on, e.g. 1000 for DAC0.
+                source: samples x targets array or iterable of such arrays.
+                scanRate (float): samples per second on each target.
+                dtype (str): 'F32' or 'U16'.
+                loop (bool): repeat an array source indefinitely.
+                kwargs: buffer_size and low_water, passed to StreamFeeder.
+
+            Returns:
+                StreamFeeder: call wait() or stop() on it and inspect its metrics.
+        '''
+        return StreamFeeder(self.labjack, targets, source, scanRate, dtype=dtype, loop=loop, **kwargs).start()
+
+    def session(self):
+        ''' Returns a StreamSession for hardware-timed stimulus/response
+            acquisition on a shared scan list. '''
+        return StreamSession(self.labjack)
+
+    def _start(self, channels, data, scanRate, loop = 0, dtype='F32', key=None):
+        ''' Uploads data to one STREAM_OUT slot per channel, starts streaming
+            and returns the actual scan rate. '''
         self.stop()
+        with self.labjack._section('upload'):
+            scan_list = self._load(channels, data, loop=loop, dtype=dtype, key=key)
+            self.labjack.barrier()
+        with self.labjack._section('start'):
+            return self.labjack.ljm.eStreamStart(self.labjack.handle, 1, len(scan_list), scan_list, scanRate)
+
+    def _load(self, channels, data, loop = 0, dtype='F32', key=None, first=0):
+        ''' Uploads one column of data to each STREAM_OUT slot from first on,
+            targeting the passed addresses, and returns the slots' scan list
+            entries. If key identifies the content of data (see BufferCache.key)
+            and the slots already hold it, the upload is skipped and only the
+            loops are restarted. '''
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
         n = np.ceil(np.log10(2*(1+len(data)))/np.log10(2))
         buffer_size = 2**n
+        if 2*buffer_size <= 16384:
+            buffer_size *= 2    ## room for a second loop, see update()
+
+        loaded = self.labjack.buffer_cache.loaded
+        slots = {first+i: (key, first+i, ch, buffer_size, loop*len(data), dtype) for i, ch in enumerate(channels)}
+        if key is not None and all(loaded.get(i) == slot for i, slot in slots.items()):
+            self.labjack.buffer_cache.stats['uploads_skipped'] += 1
+            with self.labjack.batch():
+                for i in slots:     ## restart the loaded loop from its first sample
+                    self.labjack._command(f'STREAM_OUT{i}_ENABLE', 1)
+                    self.labjack._command(f'STREAM_OUT{i}_SET_LOOP', 1)
+            return [4800+i for i in slots]
+        with self.labjack.batch():
+            for j, i in enumerate(slots):
+                loaded.pop(i, None)
+                self.labjack._command(f'STREAM_OUT{i}_ENABLE', 0)   ## re-enabling clears the buffer
+                self.buffer_sizes[i] = buffer_size
+                self.loop_sizes[i] = loop*len(data)
+                self.labjack._write_dict({f'STREAM_OUT{i}_TARGET': channels[j],
+                                  f'STREAM_OUT{i}_BUFFER_SIZE': buffer_size,
+                                  f'STREAM_OUT{i}_ENABLE': 1
+                                })
+
+                self.labjack._write_buffer(f'STREAM_OUT{i}_BUFFER_{dtype}', data[:, j])
+
+                self.labjack._write_dict({f'STREAM_OUT{i}_LOOP_SIZE': loop*len(data),
+                                  f'STREAM_OUT{i}_SET_LOOP': 1
+                                })
+        if key is not None and loop:
+            self.labjack.barrier()
+            loaded.update(slots)
+        return [4800+i for i in slots]
+
+    def update(self, data, dtype='F32', wait=False, timeout=1.0):
+        ''' Replaces the loops of the running STREAM_OUT slots 0, 1, ... (one
+            column of data each) without stopping the stream. The new data is
+            written behind the current loop and played from the next loop
+            boundary on (STREAM_OUT#_SET_LOOP = 3), so the output has no gap.
+            Both loops must fit in the buffer together, so the running loop can
+            hold at most 4095 samples (see the updatable option of
+            WaveformGenerator.start and PatternGenerator.start); if an earlier
+            update is still pending, this waits for it to take effect first.
+
+            Args:
+                data (array): samples x slots array of new loop data.
+                dtype (str): 'F32' or 'U16', as for the running stream.
+                wait (bool): if True, poll until the device has switched over.
+                timeout (float): longest time to wait for buffer space or the
+                                 switch, in seconds.
 
-        i = 0
-        scan_list = []
-        for ch in channels:
-            self.labjack._write_dict({f'STREAM_OUT{i}_TARGET': ch,
-                              f'STREAM_OUT{i}_BUFFER_SIZE': buffer_size,
-                              f'STREAM_OUT{i}_ENABLE': 1
-                            })
+            Returns:
+                metrics (dict): seconds from the call until the data was sent
+                                ('write') and, if wait is True, until the switch
+                                was observed ('switch', within one poll).
+        '''
+        started = time.monotonic()
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        slots = range(data.shape[1])
+        if any(not self.loop_sizes.get(i) for i in slots):
+            raise RuntimeError('No looped STREAM_OUT data to update; start the stream first.')
+        status = [f'STREAM_OUT{i}_BUFFER_STATUS' for i in slots]
+        capacity = min(self.buffer_sizes[i] for i in slots) // 2
+        room = min(capacity - self.loop_sizes[i] for i in slots)
+        if len(data) > room:
+            raise ValueError('%i samples do not fit next to the running loop (room for %i); '
+                             'start with a loop of at most %i samples.'%(len(data), room, Stream.MAX_UPDATABLE))
 
-            target = ['STREAM_OUT%i_BUFFER_%s'%(i, dtype)] * len(data)
-            self.labjack._write_array(target, list(data[:, i]))
+        def poll(ready):
+            while not ready(min(self.labjack._query_many(status))):
+                if time.monotonic() - started > timeout:
+                    raise TimeoutError('STREAM_OUT buffer did not drain in time.')
+                time.sleep(1e-3)
+        poll(lambda free: free >= len(data))
+        with self.labjack.batch():
+            for i in slots:
+                self.labjack.buffer_cache.loaded.pop(i, None)
+                self.labjack._command(f'STREAM_OUT{i}_LOOP_SIZE', len(data))
+                self.labjack._write_buffer(f'STREAM_OUT{i}_BUFFER_{dtype}', data[:, i])
+                self.labjack._command(f'STREAM_OUT{i}_SET_LOOP', 3)
+                self.loop_sizes[i] = len(data)
+        metrics = {'write': time.monotonic() - started}
+        if wait:
+            poll(lambda free: free >= capacity - len(data))     ## old loop released
+            metrics['switch'] = time.monotonic() - started
+        return metrics
 
-            self.labjack._write_dict({f'STREAM_OUT{i}_LOOP_SIZE': loop*len(data),
-                              f'STREAM_OUT{i}_SET_LOOP': 1
-                            })
-            scan_list.append(4800+i)
-            i += 1
-        scanRate = ljm.eStreamStart(self.labjack.handle, 1, len(scan_list), scan_list, scanRate)
+    def arm(self, ch):
+        ''' Makes subsequent waveform, pattern and ADC stream starts wait for an
+            edge on DIO channel ch instead of starting immediately. Pass None
+            to disarm. '''
+        self.trigger = ch
 
     def set_trigger(self, ch):
         if ch is None:
             self.labjack._command("STREAM_TRIGGER_INDEX", 0) # disable triggered stream
         else:
-            self.labjack._write_dict({f"DIO{ch}_EF_ENABLE": 0
-                              })
-            self.labjack._write_dict({f"DIO{ch}_EF_INDEX": 3,
-                              f"DIO{ch}_EF_OPTIONS": 12,   ## current value: 0 (PWM Out)
-                              # f"DIO{ch}_EF_VALUE_A": 2,
-                              f"DIO{ch}_EF_CONFIG_A": 1,
-                              f"DIO{ch}_EF_CONFIG_B": 1,
-                              f"DIO{ch}_EF_ENABLE": 1,
-                              "STREAM_TRIGGER_INDEX": 2000+ch
-                              })
-            ljm.writeLibraryConfigS('LJM_STREAM_RECEIVE_TIMEOUT_MS',0)  #disable timeout
+            batches = self.batches.get(('trigger', ch))
+            if batches is None:
+                batches = self.batches[('trigger', ch)] = (
+                        self.labjack.compile([f"DIO{ch}_EF_ENABLE"]),
+                        self.labjack.compile([f"DIO{ch}_EF_INDEX",
+                                              f"DIO{ch}_EF_OPTIONS",
+                                              f"DIO{ch}_EF_CONFIG_A",
+                                              f"DIO{ch}_EF_CONFIG_B",
+                                              f"DIO{ch}_EF_ENABLE",
+                                              "STREAM_TRIGGER_INDEX"]))
+            with self.labjack.batch():
+                batches[0].write([0])   ## disable before reconfiguring; same packet, applied in order
+                batches[1].write([3,
+                                  12,   ## current value: 0 (PWM Out)
+                                  1,
+                                  1,
+                                  1,
+                                  2000+ch])
+            self.labjack.ljm.writeLibraryConfigS('LJM_STREAM_RECEIVE_TIMEOUT_MS',0)  #disable timeout
@@ -0,0 +1,163 @@
+''' Continuous stream-out for sequences longer than the device's STREAM_OUT
+    buffers. A background thread polls STREAM_OUT#_BUFFER_STATUS and tops the
+    buffers up from a NumPy array or an iterator of chunks whenever they drain
+    below a low-water mark, so arbitrarily long outputs play at full speed. '''
+import itertools
+import threading
+import time
+import numpy as np
+
+class StreamFeeder:
+    ''' Feeds one or more STREAM_OUT buffers from a chunk source. Usually
+        created through Stream.feed().
+
+        Args:
+            labjack (LabJack): the device to stream to.
+            targets (list): Modbus addresses to output on, one per STREAM_OUT.
+            source: a samples x targets array, or an iterable yielding such
+                    arrays (1-D arrays are accepted for a single target).
+            scanRate (float): output samples per second on each target.
+            dtype (str): 'F32' for analog targets or 'U16' for digital ports.
+            loop (bool): if True and source is an array, repeat it indefinitely.
+            buffer_size (int): STREAM_OUT buffer size in bytes (power of 2, max 16384).
+            low_water (float): refill once the buffers are less than this fraction full.
+    '''
+    def __init__(self, labjack, targets, source, scanRate, dtype='F32', loop=False, buffer_size=16384, low_water=0.5):
+        self.labjack = labjack
+        self.targets = list(targets)
+        self.dtype = dtype
+        self.scanRate = scanRate
+        self.buffer_size = buffer_size
+        self.capacity = buffer_size // 2
+        self.low_water = low_water
+
+        if isinstance(source, np.ndarray):
+            source = itertools.repeat(source) if loop else iter([source])
+        self.source = iter(source)
+        self.pending = np.zeros((0, len(self.targets)))
+        self.exhausted = False
+
+        self.status_registers = [f'STREAM_OUT{i}_BUFFER_STATUS' for i in range(len(self.targets))]
+        self.metrics = {'samples_written': 0,
+                        'refills': 0,
+                        'polls': 0,
+                        'underruns': 0,
+                        'underrun_samples': 0,
+                        'min_fill': 1.0,
+                        'elapsed': 0.0}
+        self.error = None
+        self._empty_since = None    ## estimated time the buffers ran dry, while they are empty
+        self._last = None           ## (time, fill) of the last status read
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _take(self, n):
+        ''' Returns up to n samples from the source. '''
+        while len(self.pending) < n and not self.exhausted:
+            try:
+                chunk = np.asarray(next(self.source), dtype=float)
+            except StopIteration:
+                self.exhausted = True
+                break
+            if chunk.ndim == 1:
+                chunk = chunk.reshape(-1, len(self.targets))
+            self.pending = np.concatenate([self.pending, chunk]) if len(self.pending) else chunk
+        block, self.pending = self.pending[:n], self.pending[n:]
+        return block
+
+    def _status(self):
+        ''' Reads the buffer fill and updates the underrun metrics. A buffer
+            found empty is counted as one underrun, lasting from when the last
+            reading predicts it ran dry until the next write. '''
+        free = min(self.labjack._query_many(self.status_registers))
+        now = time.monotonic()
+        fill = max(0, self.capacity - free)
+        self.metrics['polls'] += 1
+        if not (self.exhausted and len(self.pending) == 0):
+            self.metrics['min_fill'] = min(self.metrics['min_fill'], fill / self.capacity)
+            if fill == 0 and self._empty_since is None:
+                self.metrics['underruns'] += 1
+                self._empty_since = self._last[0] + self._last[1] / self.scanRate if self._last else now
+        self._last = (now, fill)
+        return free, fill
+
+    def _write(self, n):
+        return self._send(self._take(n))
+
+    def _send(self, block):
+        if self._empty_since is not None:
+            self.metrics['underrun_samples'] += int(max(0, time.monotonic() - self._empty_since) * self.scanRate)
+            self._empty_since = None
+        with self.labjack.batch():
+            for i in range(len(self.targets)):
+                self.labjack._write_buffer(f'STREAM_OUT{i}_BUFFER_{self.dtype}', block[:, i])
+        self.metrics['samples_written'] += len(block)
+        self.metrics['refills'] += 1
+        return len(block)
+
+    def start(self):
+        ''' Prefills the buffers, starts the stream and launches the refill thread. '''
+        self.labjack.stream.stop()
+        with self.labjack.batch():
+            for i, target in enumerate(self.targets):
+                self.labjack.buffer_cache.loaded.pop(i, None)
+                self.labjack._command(f'STREAM_OUT{i}_ENABLE', 0)   ## re-enabling clears the buffer
+                self.labjack._write_dict({f'STREAM_OUT{i}_TARGET': target,
+                                          f'STREAM_OUT{i}_BUFFER_SIZE': self.buffer_size,
+                                          f'STREAM_OUT{i}_ENABLE': 1
+                                          })
+            self._write(self.capacity - 1)
+            for i in range(len(self.targets)):
+                self.labjack._write_dict({f'STREAM_OUT{i}_LOOP_SIZE': 0,
+                                          f'STREAM_OUT{i}_SET_LOOP': 1
+                                          })
+        scan_list = [4800+i for i in range(len(self.targets))]
+        self.labjack.barrier()
+        self.scanRate = self.labjack.ljm.eStreamStart(self.labjack.handle, 1, len(scan_list), scan_list, self.scanRate)
+        self._started = time.monotonic()
+        self._last = (self._started, self.capacity - 1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                free, fill = self._status()
+                if self.exhausted and len(self.pending) == 0:
+                    if fill == 0:
+                        break
+                    self._stop.wait(min(max(fill / self.scanRate, 1e-3), 0.1))
+                    continue
+                if fill < self.low_water * self.capacity:
+                    block = self._take(int(free) - 1)
+                    self._status()      ## a slow source may have let the buffers run dry
+                    self._send(block)
+                    continue
+                wait = (fill - self.low_water * self.capacity) / self.scanRate
+                self._stop.wait(min(max(wait, 1e-3), 0.1))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.metrics['elapsed'] = time.monotonic() - self._started
+            if not self._stop.is_set():
+                self.labjack.stream.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        ''' Blocks until the source is exhausted and the buffers have drained. '''
+        self._thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.metrics
+
+    def stop(self):
+        ''' Stops feeding and stops the stream. '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.labjack.stream.stop()
+        return self.metrics
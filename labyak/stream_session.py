@@ -0,0 +1,106 @@
+''' Hardware-timed stimulus/response acquisition with stream-out and stream-in
+    sharing one scan list, and therefore one clock. '''
+import numpy as np
+from labyak.digital import Digital
+
+class StreamSession:
+    ''' Plays stimuli on up to four STREAM_OUT slots while sampling inputs in
+        the same scans. Usually created through Stream.session(), e.g.
+
+            session = labjack.stream.session()
+            session.output('DAC0', V)
+            session.input(['AIN0', 'AIN1'])
+            response = session.run(scanRate=10000, repeats=4)
+
+        Outputs precede inputs in the scan list, so each scan first applies the
+        next stimulus sample and then samples the inputs: row k of the response
+        belongs to sample k % len(V) of the stimulus.
+
+        Args:
+            labjack (LabJack): the device to stream with.
+
+        Attributes:
+            scanRate (float): scan rate returned by the device on start().
+    '''
+    def __init__(self, labjack):
+        self.labjack = labjack
+        self.outputs = []
+        self.inputs = []
+        self.scanRate = None
+
+    def output(self, target, data, dtype=None):
+        ''' Adds a stimulus. All stimuli must have the same number of samples,
+            at most the 8191 which fit in a STREAM_OUT buffer.
+
+            Args:
+                target (str): output register, e.g. 'DAC0' or 'FIO_STATE'.
+                data (array): one period of the stimulus: voltages for a DAC,
+                              or U16 words from Digital.array_to_bitmask for a
+                              digital port.
+                dtype (str): 'F32' or 'U16'; defaults to U16 for digital ports
+                             and F32 otherwise.
+        '''
+        if len(self.outputs) == 4:
+            raise ValueError('The device has four STREAM_OUT slots.')
+        if dtype is None:
+            dtype = 'U16' if target in Digital.PORTS else 'F32'
+        self.outputs.append((target, np.asarray(data).ravel(), dtype))
+        return self
+
+    def input(self, channels):
+        ''' Adds inputs to sample in every scan, e.g. ['AIN0', 'FIO_STATE']. '''
+        self.inputs.extend(channels)
+        return self
+
+    @property
+    def samples(self):
+        ''' Number of samples in one period of the stimuli. '''
+        lengths = {len(data) for target, data, dtype in self.outputs}
+        if len(lengths) != 1:
+            raise ValueError('A session needs stimuli of one common length.')
+        return lengths.pop()
+
+    def start(self, scanRate, repeats=1):
+        ''' Uploads the stimuli and starts the stream, honouring Stream.arm().
+
+            Args:
+                scanRate (float): scans per second.
+                repeats (int): number of stimulus periods to acquire, or None
+                               to loop until stop().
+        '''
+        stream = self.labjack.stream
+        n = self.samples
+        stream.stop()
+        with self.labjack.batch():
+            stream.configure()
+            stream.set_trigger(stream.trigger)
+            scan_list = []
+            for i, (target, data, dtype) in enumerate(self.outputs):
+                scan_list += stream._load([self.labjack._resolve(target)[0]], data, loop=1, dtype=dtype, first=i)
+            scan_list += [self.labjack._resolve(channel)[0] for channel in self.inputs]
+            self.labjack._command('STREAM_NUM_SCANS', 0 if repeats is None else n*repeats)
+        self.labjack.barrier()
+        self.scanRate = self.labjack.ljm.eStreamStart(self.labjack.handle, n, len(scan_list), scan_list, scanRate)
+        return self.scanRate
+
+    def read(self):
+        ''' Returns the response to the next stimulus period as a scans x inputs
+            array, with scans skipped by auto-recovery as NaN. '''
+        data = np.asarray(self.labjack.stream.AIn_read()[0], dtype=float)
+        data = data.reshape(-1, len(self.outputs) + len(self.inputs))[:, len(self.outputs):]
+        data[data == -9999.0] = np.nan
+        return data
+
+    def stop(self):
+        ''' Stops the stream and clears the scan limit set by start(). '''
+        self.labjack.stream.stop()
+        self.labjack._command('STREAM_NUM_SCANS', 0)
+
+    def run(self, scanRate, repeats=1):
+        ''' Acquires the response to repeats periods of the stimuli and returns
+            it as a (repeats*samples) x inputs array aligned with the stimuli. '''
+        self.start(scanRate, repeats)
+        try:
+            return np.concatenate([self.read() for i in range(repeats)])
+        finally:
+            self.stop()
@@ -1,20 +1,66 @@
+import numpy as np
+
 class Temperature:
     def __init__(self, labjack):
         self.labjack = labjack
+        self.batches = {}
 
     def configure(self, pos_ch, neg_ch, kind, arange=0.05):
         ''' Enables temperature sensing on a given channel pair for kind = 'J' or
             kind = 'K' thermocouples.  '''
         kind = {'J': 21, 'K': 22}[kind]
-        self.labjack._command(f'AIN{pos_ch}_EF_INDEX', kind)
-        self.labjack._write_dict({f'AIN{pos_ch}_EF_INDEX': kind,
-                                  f'AIN{pos_ch}_EF_CONFIG_B': 60052,
-                                  f'AIN{pos_ch}_EF_CONFIG_D': 1,
-                                  f'AIN{pos_ch}_EF_CONFIG_E': 0,
-                                  f'AIN{pos_ch}_NEGATIVE_CH': neg_ch,
-                                  f'AIN{pos_ch}_RANGE': arange
-                                  })
+        batch = self.batches.get(('configure', pos_ch))
+        if batch is None:
+            batch = self.batches[('configure', pos_ch)] = self.labjack.compile([f'AIN{pos_ch}_EF_INDEX',
+                                                                               f'AIN{pos_ch}_EF_CONFIG_B',
+                                                                               f'AIN{pos_ch}_EF_CONFIG_D',
+                                                                               f'AIN{pos_ch}_EF_CONFIG_E',
+                                                                               f'AIN{pos_ch}_NEGATIVE_CH',
+                                                                               f'AIN{pos_ch}_RANGE'])
+        batch.write([kind, 60052, 1, 0, neg_ch, arange])    ## EF_INDEX first: it resets the other EF registers
 
     def TIn(self, ch):
         ''' Returns the temperature of a given channel in degC. '''
-        return self.labjack._query(f'AIN{ch}_EF_READ_A') - 273.15
+        batch = self.batches.get(('read', ch))
+        if batch is None:
+            batch = self.batches[('read', ch)] = self.labjack.compile([f'AIN{ch}_EF_READ_A'])
+        return batch.read()[0] - 273.15
+
+    def configure_many(self, pairs, kind, arange=0.05):
+        ''' Configures several thermocouple channel pairs in as few packets as possible.
+
+            Args:
+                pairs (dict): positive channel -> negative channel, e.g. {0: 1, 2: 3}.
+                kind (str): 'J' or 'K'.
+                arange (float): AIN range in volts.
+        '''
+        with self.labjack.batch():
+            for pos_ch, neg_ch in dict(pairs).items():
+                self.configure(pos_ch, neg_ch, kind, arange=arange)
+
+    def TIn_many(self, channels, averages=1, return_error=False):
+        ''' Returns the temperatures of several channels in degC, reading all of
+            them in one packet per averaging pass.
+
+            Args:
+                channels (list): positive channels configured with configure().
+                averages (int): number of readings averaged per channel.
+                return_error (bool): if True, also return the standard error of
+                                     each mean.
+
+            Returns:
+                T (ndarray): mean temperature of each channel.
+                err (ndarray): standard error of each mean, from the sample
+                               standard deviation, if return_error is True;
+                               NaN when averages is 1.
+        '''
+        channels = tuple(channels)
+        batch = self.batches.get(('read', channels))
+        if batch is None:
+            batch = self.batches[('read', channels)] = self.labjack.compile([f'AIN{ch}_EF_READ_A' for ch in channels])
+        vals = np.array([batch.read() for i in range(averages)]) - 273.15
+        if return_error:
+            if averages < 2:
+                return vals.mean(axis=0), np.full(len(channels), np.nan)
+            return vals.mean(axis=0), vals.std(axis=0, ddof=1) / np.sqrt(averages)
+        return vals.mean(axis=0)
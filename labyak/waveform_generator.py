@@ -1,12 +1,93 @@
-from labjack import ljm
 import numpy as np
+from labyak.stream import Stream
 
 class WaveformGenerator:
     def __init__(self, labjack):
         self.labjack = labjack
+        self.scanRate = None    ## set by start(), required by update()
 
-    def start(self, t, V, channels = [0]):
-        data, scanRate = self.labjack.stream.resample(V, np.max(t))
-        self.labjack.stream.configure(settling_time=0, resolution_index=0, clock_source=0)
-        self.labjack.stream.set_trigger(None)
-        self.labjack.stream.AOut(channels, data, scanRate, loop=1)
+    def start(self, t, V, channels = [0], continuous=False, method='fft', exact=False, binary=False, updatable=False):
+        ''' Outputs a looped waveform. If continuous is True, the waveform is
+            resampled at the maximum scan rate regardless of length and fed to
+            the device from a background thread; the StreamFeeder is returned.
+            Resampled waveforms are cached in LabJack.buffer_cache, and
+            restarting the waveform which is already loaded skips the upload.
+
+            Args:
+                t (array): sample times of V; max(t) is taken as the period.
+                V: samples x channels array of voltages, or a callable V(t)
+                   which is evaluated directly at the output sample times.
+                channels (list): DAC channels to output on.
+                continuous (bool): feed the device instead of looping its buffer.
+                method (str): resampling method, see Stream.resample.
+                exact (bool): choose a scan rate at which the loop lasts exactly
+                              one period, see Stream.resample.
+                binary (bool): quantize to calibrated DAC codes on the host and
+                               upload them as U16, halving the upload size (T7
+                               only). The worst-case output error in volts is
+                               stored in self.quantization_error.
+                updatable (bool): limit the loop to Stream.MAX_UPDATABLE samples
+                                  so that update() can replace it.
+        '''
+        with self.labjack._section('waveform.start'):
+            max_samples = None if continuous else Stream.MAX_UPDATABLE if updatable else 8191
+
+            def compile():
+                with self.labjack._section('compile'):
+                    data, scanRate = self.labjack.stream.resample(V, np.max(t), max_samples=max_samples, method=method, exact=exact)
+                    if not binary:
+                        return data, scanRate, None
+                    codes, error = self.labjack.analog.quantize(data, channels, return_error=True)
+                    return codes, scanRate, np.abs(error).max()
+            if callable(V):
+                key = None
+                data, scanRate, self.quantization_error = compile()
+            else:
+                key = self.labjack.buffer_cache.key('waveform', np.asarray(V), np.max(t), max_samples, method, exact,
+                                                    binary, list(channels), self.labjack.deviceType)
+                data, scanRate, self.quantization_error = self.labjack.buffer_cache.get(key, compile)
+            with self.labjack.batch():
+                self.labjack.stream.configure(settling_time=0, resolution_index=0, clock_source=0)
+                self.labjack.stream.set_trigger(self.labjack.stream.trigger)
+                if continuous:
+                    return self.labjack.stream.feed([1000+2*ch for ch in channels], data, scanRate, loop=True,
+                                                    dtype='U16' if binary else 'F32')
+                self.scanRate = self.labjack.stream.AOut(channels, data, scanRate, loop=1, key=key, dtype='U16' if binary else 'F32')
+            self.channels, self.binary = list(channels), binary
+
+    def update(self, t, V, method='fft', wait=False):
+        ''' Replaces the waveform started with start() at its next loop boundary,
+            without stopping the stream, so that the output has no gap. The scan
+            rate is kept and the new period max(t) is rounded to whole samples.
+            The waveform must have been started with updatable=True unless it
+            is short enough anyway.
+
+            Args:
+                t (array): sample times of V; max(t) is taken as the period.
+                V: samples x channels array of voltages, or a callable V(t).
+                method (str): resampling method, see Stream.resample.
+                wait (bool): block until the device has switched to the new data.
+
+            Returns:
+                metrics (dict): update latency, see Stream.update.
+        '''
+        if self.scanRate is None:
+            raise RuntimeError('No waveform is running; call start() first.')
+        period = np.max(t)
+        data = self.labjack.stream.resample_to(V, period, max(1, int(round(period*self.scanRate))), method=method)
+        if self.binary:
+            data, error = self.labjack.analog.quantize(data, self.channels, return_error=True)
+            self.quantization_error = np.abs(error).max()
+        return self.labjack.stream.update(data, dtype='U16' if self.binary else 'F32', wait=wait)
+
+    def feed(self, source, scanRate, channels = [0]):
+        ''' Streams an arbitrarily long waveform from an iterator yielding arrays
+            of voltages (samples x channels) at the given scan rate.
+
+            Returns:
+                StreamFeeder: call wait() or stop() on it and inspect its metrics.
+        '''
+        with self.labjack.batch():
+            self.labjack.stream.configure(settling_time=0, resolution_index=0, clock_source=0)
+            self.labjack.stream.set_trigger(self.labjack.stream.trigger)
+            return self.labjack.stream.feed([1000+2*ch for ch in channels], source, scanRate)
@@ -0,0 +1,27 @@
+''' Fixtures running labyak against the simulated LJM backend. '''
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labyak import LabJack
+from labyak.simulated import SimulatedLJM, SimulatedDevice, constants
+
+def open_labjack(connection=constants.ctETHERNET, realtime=False):
+    sim = SimulatedLJM(devices=[SimulatedDevice(connection_type=connection)], realtime=realtime)
+    lj = LabJack(backend=sim, verbose=False)
+    return sim, lj, sim._device(lj.handle)
+
+@pytest.fixture
+def sim():
+    ''' Returns (SimulatedLJM, LabJack, SimulatedDevice) on a virtual clock. '''
+    sim, lj, device = open_labjack()
+    yield sim, lj, device
+    lj.close()
+
+@pytest.fixture
+def realtime():
+    ''' As sim, but on the wall clock, for tests which wait on the device. '''
+    sim, lj, device = open_labjack(realtime=True)
+    yield sim, lj, device
+    lj.close()
@@ -0,0 +1,30 @@
+import numpy as np
+
+def test_timestamps_follow_the_scan_count(sim):
+    sim, lj, device = sim
+    lj.adc_stream.start(['AIN0', 'AIN1'], 1000)
+    first = lj.adc_stream.read()
+    second = lj.adc_stream.read()
+    assert list(first.columns) == ['AIN0', 'AIN1']
+    assert first.index[0] == lj.adc_stream.start_time
+    times = first.index.append(second.index).values
+    assert np.all(np.diff(times) == np.timedelta64(1, 'ms'))
+    assert lj.adc_stream.scan_count == len(times)
+
+def test_times_are_exact_at_fractional_periods(sim):
+    sim, lj, device = sim
+    lj.adc_stream.start(['AIN0'], 3000)
+    lj.adc_stream.start_time = np.datetime64('2024-01-01T00:00:00', 'ns')
+    times = lj.adc_stream.times(0, 3001)
+    assert times[3000] == np.datetime64('2024-01-01T00:00:01', 'ns')
+    assert times[1] - times[0] == np.timedelta64(333333, 'ns')
+
+def test_skipped_scans_keep_their_slots(sim):
+    import pandas as pd
+    sim, lj, device = sim
+    lj.adc_stream.start(['AIN0'], 1000)
+    sim.advance(20)     ## overflows the 16384-scan device buffer
+    data = pd.concat([lj.adc_stream.read() for i in range(40)])
+    assert data['AIN0'].isna().sum() == device.skipped == 20000 - 16384
+    assert np.all(np.diff(data.index.values) == np.timedelta64(1, 'ms'))
+    assert data.index[-1] == lj.adc_stream.start_time + np.timedelta64(19999, 'ms')
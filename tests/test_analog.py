@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from labyak.simulated import REGISTERS
+
+def test_many_channels_in_one_packet(sim):
+    sim, lj, device = sim
+    device.loopback = {0: 'DAC0', 1: 'DAC1'}
+    sim.reset_stats()
+    lj.analog.AOut_many({0: 1.5, 1: 2.5})
+    lj.barrier()
+    V = lj.analog.AIn_many([0, 1, 2])
+    assert sim.stats()['total']['packets'] == 2
+    assert V[:2] == pytest.approx([1.5, 2.5])
+    assert V[2] == pytest.approx(np.sin(2*np.pi*3*sim.now()), abs=1e-6)
+
+def test_configure_broadcasts_and_maps_settings(sim):
+    sim, lj, device = sim
+    lj.analog.configure([0, 1], arange=1, resolution={1: 8}, settling=None)
+    regs = {name: device.regs.get(REGISTERS[name][0]) for name in
+            ['AIN0_RANGE', 'AIN1_RANGE', 'AIN0_RESOLUTION_INDEX', 'AIN1_RESOLUTION_INDEX', 'AIN0_SETTLING_US']}
+    assert regs == {'AIN0_RANGE': 1, 'AIN1_RANGE': 1, 'AIN0_RESOLUTION_INDEX': None,
+                    'AIN1_RESOLUTION_INDEX': 8, 'AIN0_SETTLING_US': None}
+
+def test_slow_sample_polls(sim):
+    sim, lj, device = sim
+    device.loopback = {0: 'DAC0'}
+    lj.analog.AOut(0, 2)
+    data = lj.analog.sample([0, 1], 100, 0.05)
+    assert data.shape == (5, 2)
+    assert np.allclose(data[:, 0], 2)
+    assert 'eStreamStart' not in sim.stats()
+
+def test_fast_sample_streams(sim):
+    sim, lj, device = sim
+    data = lj.analog.sample([0], 1000, 0.75)
+    assert data.shape == (750, 1)
+    assert 'eStreamStart' in sim.stats() and not device.running
+    t = np.arange(750) / 1000
+    assert np.allclose(data[:, 0], np.sin(2*np.pi*t))
+
+def test_skipped_stream_scans_are_nan(sim):
+    sim, lj, device = sim
+    device.ain_source = lambda ch, t: np.where(t < 0.1, -9999.0, 1.0)
+    data = lj.analog.sample([0, 1], 1000, 0.5)
+    assert np.isnan(data[:100]).all() and (data[100:] == 1).all()
@@ -0,0 +1,44 @@
+import asyncio
+import subprocess
+import sys
+import numpy as np
+import pytest
+from labyak import AsyncLabJack
+from conftest import open_labjack
+
+def test_import_is_lazy():
+    probe = "import sys, labyak; print('asyncio' in sys.modules, 'concurrent.futures' in sys.modules)"
+    out = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ['False', 'False']
+
+def test_calls_run_in_order_on_the_worker_thread():
+    sim, lj, device = open_labjack()
+    device.loopback = {0: 'DAC0'}
+
+    async def main():
+        alj = AsyncLabJack(lj)
+        await alj.analog.AOut(0, 1.5)
+        V = await alj.analog.AIn(0)
+        await alj.close()
+        return V
+    assert asyncio.run(main()) == pytest.approx(1.5, abs=1e-3)
+
+def test_blocks_stop_the_stream_on_exit():
+    sim, lj, device = open_labjack()
+
+    async def main():
+        alj = AsyncLabJack(lj)
+        received = []
+        async with alj.adc_stream.blocks(['AIN0'], 1000) as blocks:
+            async for times, data in blocks:
+                received.append((times, data))
+                if len(received) == 3:
+                    break
+        running = device.running
+        await alj.close()
+        return received, running
+    received, running = asyncio.run(main())
+    assert not running
+    times = np.concatenate([t for t, d in received])
+    assert len(times) == 3*500
+    assert np.all(np.diff(times) == np.timedelta64(1, 'ms'))
@@ -0,0 +1,41 @@
+import numpy as np
+from labyak import BufferCache
+
+def test_hits_and_eviction():
+    cache = BufferCache(max_bytes=2*800)
+    compiled = []
+
+    def compile(i):
+        compiled.append(i)
+        return np.full(100, i, dtype=float), i
+
+    for i in [0, 1, 0, 2, 1]:
+        cache.get(BufferCache.key('test', i), lambda: compile(i))
+    assert compiled == [0, 1, 2, 1]
+    assert cache.stats['hits'] == 1
+    assert cache.stats['evictions'] == 2
+    assert cache.stats['bytes'] <= cache.max_bytes
+
+def test_key_depends_on_content():
+    a = np.arange(10.)
+    assert BufferCache.key(a) == BufferCache.key(a.copy())
+    assert BufferCache.key(a) != BufferCache.key(a + 1)
+    assert BufferCache.key(a) != BufferCache.key(a.astype(np.float32))
+
+def test_key_hashes_arrays_inside_sequences():
+    a, b = np.zeros(2000), np.zeros(2000)
+    b[1234] = 1
+    assert repr([a]) == repr([b])
+    assert BufferCache.key([(0, a)]) != BufferCache.key([(0, b)])
+
+def test_long_patterns_are_not_confused(sim):
+    sim, lj, device = sim
+    times = np.arange(2000) * 1e-5
+    first = {0: np.column_stack([times, np.arange(2000) % 2])}
+    second = {0: first[0].copy()}
+    second[0][1500, 1] = 1 - second[0][1500, 1]
+    lj.pattern.start(first, 0.02)
+    loop = device.stream_outs[0].loop.copy()
+    lj.pattern.start(second, 0.02)
+    assert lj.buffer_cache.stats['uploads_skipped'] == 0
+    assert not np.array_equal(device.stream_outs[0].loop, loop)
@@ -0,0 +1,47 @@
+def test_batch_sends_one_packet(sim):
+    sim, lj, device = sim
+    sim.reset_stats()
+    with lj.batch():
+        lj._command('DAC0', 1.0)
+        lj._command('DAC1', 2.0)
+        lj._command('AIN0_RANGE', 10)
+        assert sim.stats()['total']['calls'] == 0
+    assert sim.stats()['total']['packets'] == 1
+    assert lj._query('DAC1') == 2.0
+
+def test_shadow_cache_skips_unchanged_writes(sim):
+    sim, lj, device = sim
+    lj._command('AIN0_RANGE', 10)
+    sim.reset_stats()
+    lj._command('AIN0_RANGE', 10)
+    assert sim.stats()['total']['calls'] == 0
+    lj.invalidate(['AIN0_RANGE'])
+    lj._command('AIN0_RANGE', 10)
+    assert sim.stats()['total']['calls'] == 1
+
+def test_outputs_are_never_shadowed(sim):
+    sim, lj, device = sim
+    lj._command('DAC0', 1.0)
+    sim.reset_stats()
+    lj._command('DAC0', 1.0)
+    assert sim.stats()['total']['calls'] == 1
+
+def test_write_keywords_and_read_array(sim):
+    sim, lj, device = sim
+    lj._write(DAC0=1.5, DAC1=0.5)
+    assert lj._query_many(['DAC0', 'DAC1']) == [1.5, 0.5]
+    lj.spi.transfer([1, 2, 3])
+    assert list(lj._read_array('SPI_DATA_RX', 3)) == [1, 2, 3]
+
+def test_profile_attributes_calls(sim):
+    sim, lj, device = sim
+    lj.profile()
+    lj.analog.AIn(0)
+    lj.spi.transfer([1, 2])
+    stats = lj.stats()
+    assert stats['methods']['Analog.AIn']['calls'] == 1
+    assert stats['methods']['SPI.transfer']['calls'] == 1
+    assert stats['registers']['AIN0'] == 1
+    lj.profile(False)
+    lj.analog.AIn(0)
+    assert lj.stats()['ops']['eReadAddress']['calls'] == 1
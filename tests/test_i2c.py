@@ -0,0 +1,47 @@
+import pytest
+from labyak.simulated import constants
+from conftest import open_labjack
+
+@pytest.fixture(params=[constants.ctUSB, constants.ctETHERNET], ids=['USB', 'ETHERNET'])
+def i2c(request):
+    sim, lj, device = open_labjack(request.param)
+    device.i2c_slaves = {0x48: bytearray(range(256)), 0x50: bytearray(256)}
+    lj.i2c.initialize()
+    yield sim, lj, device
+    lj.close()
+
+@pytest.mark.parametrize('n', [1, 20, 55, 100])
+def test_write_and_burst_read(i2c, n):
+    sim, lj, device = i2c
+    data = [(7*i) % 256 for i in range(n)]
+    lj.i2c.write(0x50, 3, data)
+    assert bytes(device.i2c_slaves[0x50][3:3+n]) == bytes(data)
+    assert lj.i2c.read(0x50, 3, n) == data
+
+def test_read_many(i2c):
+    sim, lj, device = i2c
+    assert lj.i2c.read_many([(0x48, 10, 3), (0x48, 0, 2)]) == [[10, 11, 12], [0, 1]]
+
+def test_scan_and_check(i2c):
+    sim, lj, device = i2c
+    sim.reset_stats()
+    assert lj.i2c.scan() == [0x48, 0x50]
+    if device.max_bytes > 64:
+        assert sim.stats()['total']['packets'] <= 2
+    assert lj.i2c.check(0x48) and not lj.i2c.check(0x49)
+
+def test_missing_device_raises(i2c):
+    sim, lj, device = i2c
+    with pytest.raises(IOError):
+        lj.i2c.read(0x10, 0, 1)
+
+def test_register_cache(i2c):
+    sim, lj, device = i2c
+    assert lj.i2c.read(0x48, 0, 2, cached=True) == [0, 1]
+    sim.reset_stats()
+    assert lj.i2c.read(0x48, 0, 2, cached=True) == [0, 1]
+    assert sim.stats()['total']['calls'] == 0
+    lj.i2c.write(0x48, 1, [9])
+    assert lj.i2c.read(0x48, 0, 2, cached=True) == [0, 9]
+    lj.i2c.invalidate(0x48)
+    assert lj.i2c.registers == {}
@@ -0,0 +1,30 @@
+import numpy as np
+from labyak import Digital
+from labyak.stream import Stream
+
+def test_optimize_stream_places_edges_exactly(sim):
+    sim, lj, device = sim
+    data, scanRate = lj.pattern.optimize_stream({0: [(0, 1), (0.25e-3, 0)], 1: [(0.5e-3, 1)]}, 1e-3)
+    assert lj.pattern.timing_error == 0
+    edges = np.flatnonzero(np.diff(data[:, 0])) + 1
+    assert np.allclose(edges / scanRate, [0.25e-3])
+    assert data[0, 0] == 1 and data[-1, 1] == 1
+
+def test_nearest_divisor_chunks_match_dense_search():
+    rng = np.random.default_rng(0)
+    ticks = np.sort(rng.integers(0, 10**7, 5000))
+    lo = 800
+    d = np.arange(lo, 2*lo)
+    points = np.append(ticks, 10**7)[:, None]
+    dense = d[np.argmin(np.abs(np.round(points / d) * d - points).max(axis=0))]
+    assert Stream.nearest_divisor(ticks, 10**7, lo, None, block=10**4) == dense
+
+def test_array_to_bitmask_inhibits_other_lines():
+    words = Digital.array_to_bitmask(np.array([[1, 0], [0, 1]]), [0, 2])
+    assert words.dtype == np.uint16
+    inhibit = (0xFF & ~0b101) << 8
+    assert list(words[:, 0]) == [inhibit | 0b001, inhibit | 0b100]
+
+def test_array_to_bitmask_spans_ports():
+    words = Digital.array_to_bitmask(np.ones((3, 2)), [0, 8])
+    assert words.shape == (3, 2)
@@ -0,0 +1,34 @@
+import datetime
+import time
+import numpy as np
+from labyak import LabJackPool
+from labyak.simulated import SimulatedLJM, SimulatedDevice
+
+def open_pool(n=2, realtime=True):
+    sim = SimulatedLJM(devices=[SimulatedDevice(serial=470000000+i) for i in range(n)], realtime=realtime)
+    return sim, LabJackPool([str(470000000+i) for i in range(n)], backend=sim)
+
+def test_open_and_map():
+    sim, pool = open_pool()
+    assert len(pool) == 2 and not pool.errors
+    assert sorted(pool.map(lambda lj: lj.handle).values()) == sorted(sim.handles)
+    pool.close()
+
+def test_missing_device_is_recorded():
+    sim = SimulatedLJM(devices=[SimulatedDevice()])
+    pool = LabJackPool(['470000000', '470099999'], backend=sim)
+    assert list(pool.devices) == ['470000000']
+    assert '470099999' in pool.errors
+    pool.close()
+
+def test_synchronized_timestamps_start_at_the_trigger():
+    sim, pool = open_pool()
+    pool.start_synchronized(0, lambda lj: lj.adc_stream.start(['AIN0'], 1000))
+    assert all(lj.adc_stream.start_time is None for lj in pool)
+    time.sleep(0.3)
+    fired = np.datetime64(datetime.datetime.utcnow(), 'ns')
+    sim.trigger()
+    first = pool.map(lambda lj: lj.adc_stream.read().index[0])
+    for t in first.values():
+        assert abs(t - fired) < np.timedelta64(30, 'ms')
+    pool.close()
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from conftest import open_labjack
+from labyak.simulated import constants
+
+CALIBRATION = [(13100.0, 120.0), (13300.0, -60.0)]
+
+def test_dac_calibration_is_read_once(sim):
+    sim, lj, device = sim
+    device.dac_calibration = CALIBRATION
+    assert np.allclose(lj.analog.dac_calibration(), CALIBRATION)
+    sim.reset_stats()
+    lj.analog.dac_calibration()
+    assert sim.stats()['total']['calls'] == 0
+
+def test_dac_calibration_requires_t7():
+    sim, lj, device = open_labjack()
+    device.device_type = lj.deviceType = constants.dtT4
+    with pytest.raises(ValueError):
+        lj.analog.dac_calibration()
+    lj.close()
+
+def test_quantize_rounds_to_12_bits_and_clips(sim):
+    sim, lj, device = sim
+    device.dac_calibration = CALIBRATION
+    V = np.column_stack([np.linspace(-1, 6, 1001), np.linspace(0, 4, 1001)])
+    codes, error = lj.analog.quantize(V, [0, 1], return_error=True)
+    assert codes.dtype == np.uint16 and codes.shape == V.shape
+    assert np.all(codes & 0xF == 0) and codes.max() <= 0xFFF0
+    assert codes[0, 0] == 0 and codes[-1, 0] == 0xFFF0
+    slope = np.array([c[0] for c in CALIBRATION])
+    inside = (V > 0.05) & (V < 4.9)
+    assert np.all((np.abs(error) <= 8 / slope + 1e-12)[inside])
+    assert error[0, 0] > 0.9 and error[-1, 0] < -0.9      ## clipped ends
+
+def test_binary_waveform_uploads_codes(sim):
+    sim, lj, device = sim
+    t = np.linspace(0, 1e-2, 100)
+    V = 2 + np.sin(2*np.pi*100*t).reshape(-1, 1)
+    sim.reset_stats()
+    lj.waveform.start(t, V)
+    f32 = sim.stats()['total']['bytes_out']
+    sim.reset_stats()
+    lj.waveform.start(t, 0.5*V, binary=True)
+    u16 = sim.stats()['total']['bytes_out']
+    slot = device.stream_outs[0]
+    assert slot.binary and np.all(np.asarray(slot.loop).astype(int) & 0xF == 0)
+    assert u16 < 0.6*f32
+    assert 0 < lj.waveform.quantization_error <= 8 / 13200 + 1e-12
+    sim.advance(1e-3)       ## the simulator converts the played codes back to volts
+    assert 0.5 - 1e-3 <= lj._query('DAC0') <= 1.5 + 1e-3
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+from labyak import RingBuffer, StreamReader
+from labyak.recorder import StreamRecorder
+
+def test_ring_buffer_wraps():
+    ring = RingBuffer(5, 1)
+    ring.write(np.arange(3))
+    data, cursor, first = ring.since(0)
+    assert list(data[:, 0]) == [0, 1, 2] and cursor == 3
+    ring.write(np.arange(3, 10))
+    assert list(ring.latest(5)[:, 0]) == [5, 6, 7, 8, 9]
+    data, cursor, first = ring.since(cursor)
+    assert first == 5 and cursor == 10
+
+def test_recorder_round_trip(tmp_path):
+    start = np.datetime64('2024-01-01T00:00:00', 'ns')
+    recorder = StreamRecorder(os.path.join(tmp_path, 'rec'), ['AIN0', 'AIN1'], 1000, start, segment_scans=7)
+    data = np.arange(40.).reshape(-1, 2)
+    recorder.write(data[:5])
+    recorder.write(data[5:])
+    recorder.close()
+    reader = StreamReader(os.path.join(tmp_path, 'rec'))
+    times, read = reader.read()
+    assert np.array_equal(read, data)
+    assert times[1] - times[0] == np.timedelta64(1, 'ms')
+    times, read = reader.read(0.005, 0.010)
+    assert np.array_equal(read, data[5:10])
+
+def test_background_recording_is_contiguous(realtime, tmp_path):
+    import time
+    sim, lj, device = realtime
+    lj.adc_stream.start_background(['AIN0'], 2000)
+    lj.adc_stream.record(os.path.join(tmp_path, 'rec'))
+    time.sleep(1.2)
+    lj.adc_stream.stop()
+    assert lj.adc_stream.error is None
+    reader = StreamReader(os.path.join(tmp_path, 'rec'))
+    anchor = (reader.start_time - lj.adc_stream.start_time) / np.timedelta64(1, 's') * lj.adc_stream.scanRate
+    assert round(anchor) + reader.scans == lj.adc_stream.scan_count
+
+def test_triggered_recording_is_anchored_at_the_trigger(realtime, tmp_path):
+    import datetime, time
+    sim, lj, device = realtime
+    lj.stream.arm(0)
+    lj.adc_stream.start_background(['AIN0'], 2000)
+    lj.stream.arm(None)
+    lj.adc_stream.record(os.path.join(tmp_path, 'rec'))
+    time.sleep(0.2)
+    fired = np.datetime64(datetime.datetime.utcnow(), 'ns')
+    sim.trigger()
+    time.sleep(1.2)
+    lj.adc_stream.stop()
+    reader = StreamReader(os.path.join(tmp_path, 'rec'))
+    assert reader.start_time == lj.adc_stream.start_time
+    assert abs(reader.start_time - fired) < np.timedelta64(30, 'ms')
@@ -0,0 +1,20 @@
+import threading
+
+def test_virtual_clock_read_does_not_hang_on_rounding(sim):
+    sim, lj, device = sim
+    sim.advance(1.8)        ## (2.3 - 1.8)*1000 rounds down to 499 scans
+    lj.stream.AIn_start(['AIN0'], 1000)
+    done = []
+    thread = threading.Thread(target=lambda: done.append(lj.stream.AIn_read()), daemon=True)
+    thread.start()
+    thread.join(10)
+    assert done, 'eStreamRead did not return on the virtual clock'
+    assert len(done[0][0]) == 500
+
+def test_advance_produces_exact_scan_counts(sim):
+    sim, lj, device = sim
+    sim.advance(1.8)
+    lj.stream.AIn_start(['AIN0'], 1000)
+    for k in (1, 499, 500, 12345):
+        device.advance(device.start_time + k / device.scan_rate)
+        assert device.produced == k
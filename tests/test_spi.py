@@ -0,0 +1,11 @@
+def test_transfer_loopback(sim):
+    sim, lj, device = sim
+    assert lj.spi.transfer(list(range(200))) == bytes(range(200))
+
+def test_transfer_many_packs_packets(sim):
+    sim, lj, device = sim
+    device.spi_handler = lambda tx: [b ^ 0xFF for b in tx]
+    sim.reset_stats()
+    results = lj.spi.transfer_many([[i, i+1] for i in range(100)])
+    assert results[5] == bytes([5 ^ 0xFF, 6 ^ 0xFF])
+    assert sim.stats()['total']['packets'] <= 2
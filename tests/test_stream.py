@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+def sine(f, samples=200):
+    t = np.linspace(0, 1/f, samples)
+    return t, np.sin(2*np.pi*f*t).reshape(-1, 1)
+
+def test_update_before_start_raises(sim):
+    sim, lj, device = sim
+    with pytest.raises(RuntimeError):
+        lj.waveform.update(*sine(5))
+    with pytest.raises(RuntimeError):
+        lj.stream.update(np.zeros(10))
+
+def test_update_of_full_loop_raises_instead_of_timing_out(sim):
+    sim, lj, device = sim
+    lj.waveform.start(*sine(5))
+    assert lj.stream.loop_sizes[0] == 8191
+    with pytest.raises(ValueError):
+        lj.waveform.update(*sine(5), wait=True)
+
+def test_updatable_loop_switches(realtime):
+    sim, lj, device = realtime
+    lj.waveform.start(*sine(5), updatable=True)
+    assert lj.stream.loop_sizes[0] == lj.stream.MAX_UPDATABLE
+    t, V = sine(50)
+    metrics = lj.waveform.update(t, 0.5*V, wait=True)
+    assert 'switch' in metrics
+    assert np.abs(device.stream_outs[0].loop).max() == pytest.approx(0.5, abs=1e-3)
+
+def test_restart_from_cache_replays_from_start(sim):
+    sim, lj, device = sim
+    sequence = {0: [(0, 1), (0.3e-3, 0)]}
+    lj.pattern.start(sequence, 1e-3)
+    sim.advance(1.234e-3)
+    assert device.stream_outs[0].loop_pos != 0
+    lj.pattern.start(sequence, 1e-3)
+    assert lj.buffer_cache.stats['uploads_skipped'] == 1
+    assert device.stream_outs[0].loop_pos == 0
+    assert len(device.stream_outs[0].loop) == 10
+
+def test_reload_replaces_buffer(sim):
+    sim, lj, device = sim
+    t, V = sine(5)
+    lj.waveform.start(t, V)
+    lj.waveform.start(t, 0.5*V)
+    assert len(device.stream_outs[0].loop) == 8191
+    assert np.abs(device.stream_outs[0].loop).max() == pytest.approx(0.5, abs=1e-3)
+
+def test_session_aligns_response(sim):
+    sim, lj, device = sim
+    device.loopback = {0: 'DAC0'}
+    V = np.linspace(0, 5, 100)
+    session = lj.stream.session().output('DAC0', V).input(['AIN0'])
+    response = session.run(scanRate=10000, repeats=2)
+    assert np.allclose(response[:, 0], np.tile(V, 2))
+
+@pytest.mark.parametrize('method', ['fft', 'poly', 'linear'])
+def test_resample_exact_period(sim, method):
+    sim, lj, device = sim
+    t, V = sine(7, 1000)
+    data, scanRate = lj.stream.resample(V, 1/7, method=method, exact=True)
+    ticks = lj.stream.CLOCK / scanRate
+    assert ticks == round(ticks)
+    assert len(data) * ticks == pytest.approx(lj.stream.CLOCK / 7, abs=1)
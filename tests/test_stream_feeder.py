@@ -0,0 +1,35 @@
+import time
+import numpy as np
+
+def test_fast_source_never_underruns(realtime):
+    sim, lj, device = realtime
+    feeder = lj.stream.feed([1000], np.ones(30000), 100000)
+    metrics = feeder.wait(5)
+    assert metrics['samples_written'] == 30000
+    assert metrics['underruns'] == 0 and metrics['underrun_samples'] == 0
+    assert 0 < metrics['min_fill'] <= 1
+
+def test_slow_source_reports_underruns(realtime):
+    sim, lj, device = realtime
+
+    def slow():
+        for i in range(5):
+            time.sleep(0.2)     ## 5000 samples last 50 ms at 100 kS/s
+            yield np.ones(5000)
+    metrics = lj.stream.feed([1000], slow(), 100000).wait(5)
+    assert metrics['underruns'] >= 1
+    assert metrics['min_fill'] == 0
+    assert metrics['underrun_samples'] == np.clip(metrics['underrun_samples'],
+                                                  0.8*device.stream_outs[0].underruns,
+                                                  1.2*device.stream_outs[0].underruns)
+
+def test_looped_source_refills_until_stopped(realtime):
+    sim, lj, device = realtime
+    feeder = lj.stream.feed([1000], np.ones(1000), 100000, loop=True)
+    time.sleep(0.3)
+    assert feeder.running
+    metrics = feeder.stop()
+    assert not feeder.running and not device.running
+    assert metrics['refills'] > 1 and metrics['polls'] >= metrics['refills'] - 1
+    assert metrics['samples_written'] > 0.2*100000
+    assert metrics['elapsed'] >= 0.3
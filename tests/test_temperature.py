@@ -0,0 +1,9 @@
+import numpy as np
+
+def test_standard_error(sim):
+    sim, lj, device = sim
+    lj.temperature.configure_many({0: 1}, 'K')
+    T, err = lj.temperature.TIn_many([0], averages=1, return_error=True)
+    assert np.isnan(err).all()
+    T, err = lj.temperature.TIn_many([0], averages=4, return_error=True)
+    assert np.isfinite(err).all()